@@ -3,6 +3,9 @@ const DEFAULT_ICONS = ['🏎️', '🐎', '🚀', '🏍️', '🛸'];
 const INITIAL_INVESTMENT = 100000;
 const NUM_PLAYERS = 5;
 
+// Leagues other than the default one are edited with ?competition=<id>
+const COMPETITION_ID = new URLSearchParams(window.location.search).get('competition');
+
 let competition = null;
 let isAuthenticated = false;
 
@@ -16,7 +19,13 @@ const pendingIcons = {};
 
 // Check if already authenticated (session)
 async function checkAuth() {
-    // Skip login for now - go straight to admin panel
+    // Skip login for now - go straight to admin panel. Leagues other than
+    // the default one can only be saved by a logged-in admin.
+    if (COMPETITION_ID) {
+        const response = await fetch('/api/admin/check');
+        const { authenticated } = await response.json();
+        if (!authenticated) return;
+    }
     showAdminPanel();
 }
 
@@ -57,8 +66,9 @@ async function showAdminPanel() {
     adminView.classList.remove('hidden');
 
     // Load competition data
-    const response = await fetch('/api/competition');
-    competition = await response.json();
+    const response = await fetch(COMPETITION_ID ? `/api/competitions/${encodeURIComponent(COMPETITION_ID)}` : '/api/competition');
+    // A league that doesn't exist yet is created on save
+    competition = response.ok ? await response.json() : null;
 
     generatePlayerForms();
     loadExistingData();
@@ -261,6 +271,24 @@ document.getElementById('save-competition').addEventListener('click', async () =
         players.push(playerData);
     }
 
+    // Validate every ticker in one request before saving
+    try {
+        const symbols = players.flatMap(p => [...p.longs, p.short]);
+        const validateResponse = await fetch('/api/validate-symbols', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ symbols })
+        });
+        if (validateResponse.ok) {
+            const { invalid } = await validateResponse.json();
+            if (invalid.length > 0 && !confirm(`These symbols could not be validated: ${invalid.join(', ')}\n\nSave anyway?`)) {
+                return;
+            }
+        }
+    } catch (error) {
+        console.error('Error validating symbols:', error);
+    }
+
     const competitionData = {
         name,
         start_date: startDate,
@@ -270,7 +298,7 @@ document.getElementById('save-competition').addEventListener('click', async () =
     };
 
     try {
-        const response = await fetch('/api/admin/save', {
+        const response = await fetch(COMPETITION_ID ? `/api/admin/save/${encodeURIComponent(COMPETITION_ID)}` : '/api/admin/save', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify(competitionData)
@@ -293,7 +321,7 @@ document.getElementById('save-competition').addEventListener('click', async () =
 
 // Back to site
 document.getElementById('back-to-site').addEventListener('click', () => {
-    window.location.href = '/';
+    window.location.href = '/' + window.location.search;
 });
 
 // Initialize
@@ -3,6 +3,14 @@ const DEFAULT_ICONS = ['🏎️', '🐎', '🚀', '🏍️', '🛸'];
 const INITIAL_INVESTMENT = 100000;
 const NUM_PLAYERS = 5;
 
+// Leagues other than the default one are opened with ?competition=<id>
+const COMPETITION_ID = new URLSearchParams(window.location.search).get('competition');
+
+function competitionApi(path = '') {
+    if (!COMPETITION_ID) return path ? `/api/${path}` : '/api/competition';
+    return `/api/competitions/${encodeURIComponent(COMPETITION_ID)}${path ? `/${path}` : ''}`;
+}
+
 // Player icons - can be emoji or custom uploaded images
 let playerIcons = [];  // Will hold Image objects for race mode
 
@@ -141,7 +149,7 @@ const loadingEl = document.getElementById('loading');
 
 // Initialize
 async function init() {
-    const response = await fetch('/api/competition');
+    const response = await fetch(competitionApi());
     competition = await response.json();
 
     if (competition && competition.players && competition.players.length > 0) {
@@ -211,6 +219,78 @@ async function showDashboard() {
     generatePlayerToggles();
     await initializePlayerIcons();
     loadPerformanceData();
+    subscribeLeaderboard();
+}
+
+// Live leaderboard: when the server reports a new version, fetch just the
+// new days and redraw. Standings only change during the day in market
+// hours, when the server's background refresher values them from intraday
+// bars; the stream is preferred, and when the server has no stream slot
+// free (a 204 closes the EventSource) we poll instead.
+const LEADERBOARD_POLL_MS = 60000;
+let leaderboardSource = null;
+let leaderboardVersion = null;
+
+async function subscribeLeaderboard() {
+    if (leaderboardSource || leaderboardVersion) return;
+
+    let state;
+    try {
+        const response = await fetch(competitionApi('leaderboard'));
+        if (!response.ok) return;
+        state = await response.json();
+    } catch (error) {
+        console.error('Error loading leaderboard:', error);
+        return;
+    }
+    leaderboardVersion = state.version;
+    if (!state.live) return;
+
+    if (!window.EventSource) {
+        setTimeout(pollLeaderboard, LEADERBOARD_POLL_MS);
+        return;
+    }
+
+    leaderboardSource = new EventSource(competitionApi('leaderboard/stream'));
+    leaderboardSource.addEventListener('leaderboard', (event) => applyLeaderboardUpdate(JSON.parse(event.data)));
+    leaderboardSource.addEventListener('error', () => {
+        if (leaderboardSource.readyState === EventSource.CLOSED) {
+            leaderboardSource = null;
+            setTimeout(pollLeaderboard, LEADERBOARD_POLL_MS);
+        }
+    });
+}
+
+async function pollLeaderboard() {
+    try {
+        const response = await fetch(`${competitionApi('leaderboard')}?version=${encodeURIComponent(leaderboardVersion)}`);
+        if (response.ok) {
+            await applyLeaderboardUpdate(await response.json());
+        }
+    } catch (error) {
+        console.error('Error polling leaderboard:', error);
+    }
+    setTimeout(pollLeaderboard, LEADERBOARD_POLL_MS);
+}
+
+async function applyLeaderboardUpdate(update) {
+    leaderboardVersion = update.version;
+    const cached = loadPerformanceCache();
+    if (!performanceData || (cached && cached.version === update.version)) return;
+
+    try {
+        const data = await fetchPerformanceData();
+        if (data.error) return;
+        performanceData = await withLivePoint(data);
+
+        // Don't yank the data out from under a running race or GIF
+        if (!racePlaying && !gifRecording) {
+            updateChart();
+            updateStandings();
+        }
+    } catch (error) {
+        console.error('Error applying leaderboard update:', error);
+    }
 }
 
 function generatePlayerForms() {
@@ -343,12 +423,102 @@ function generatePlayerToggles() {
     });
 }
 
+// Performance history is cached in localStorage and topped up with only
+// the trading days added since the last visit
+const PERFORMANCE_CACHE_KEY = COMPETITION_ID ? `performanceCache:${COMPETITION_ID}` : 'performanceCache';
+
+function loadPerformanceCache() {
+    try {
+        const cached = JSON.parse(localStorage.getItem(PERFORMANCE_CACHE_KEY));
+        if (cached && cached.version && cached.data && cached.data.trading_days.length > 0) {
+            return cached;
+        }
+    } catch (error) {
+        console.error('Error reading performance cache:', error);
+    }
+    return null;
+}
+
+function savePerformanceCache(version, data) {
+    try {
+        localStorage.setItem(PERFORMANCE_CACHE_KEY, JSON.stringify({ version, data }));
+    } catch (error) {
+        // Storage full or disabled - just skip caching
+        console.error('Error saving performance cache:', error);
+    }
+}
+
+function mergePerformanceDelta(data, delta) {
+    return {
+        ...data,
+        trading_days: data.trading_days.concat(delta.trading_days),
+        players: data.players.map((player, i) => ({
+            ...player,
+            history: player.history.concat(delta.players[i].history)
+        }))
+    };
+}
+
+async function fetchPerformanceData() {
+    const cached = loadPerformanceCache();
+
+    if (cached) {
+        const lastDay = cached.data.trading_days[cached.data.trading_days.length - 1];
+        const response = await fetch(`${competitionApi('performance')}?since=${lastDay}&version=${encodeURIComponent(cached.version)}`);
+        const delta = await response.json();
+        if (delta.error) return delta;
+
+        const canMerge = delta.delta && delta.players.length === cached.data.players.length;
+        if (canMerge || !delta.delta) {
+            const data = canMerge ? mergePerformanceDelta(cached.data, delta) : delta;
+            savePerformanceCache(delta.version, data);
+            return data;
+        }
+    }
+
+    const response = await fetch(competitionApi('performance'));
+    const data = await response.json();
+    if (!data.error) {
+        savePerformanceCache((response.headers.get('ETag') || '').replace(/"/g, ''), data);
+    }
+    return data;
+}
+
+// Regular US market hours: 9:30-16:00 New York time, Monday-Friday
+function isMarketOpen() {
+    const parts = Object.fromEntries(new Intl.DateTimeFormat('en-US', {
+        timeZone: 'America/New_York', weekday: 'short', hour: 'numeric', minute: 'numeric', hourCycle: 'h23'
+    }).formatToParts(new Date()).map(part => [part.type, part.value]));
+    if (parts.weekday === 'Sat' || parts.weekday === 'Sun') return false;
+    const minutes = parseInt(parts.hour) * 60 + parseInt(parts.minute);
+    return minutes >= 9 * 60 + 30 && minutes < 16 * 60;
+}
+
+// Add today's live value during market hours. It is kept out of the
+// localStorage cache so the final close still arrives as a normal day.
+async function withLivePoint(data) {
+    if (!isMarketOpen()) return data;
+    try {
+        const lastDay = data.trading_days[data.trading_days.length - 1];
+        const response = await fetch(`${competitionApi('performance')}?intraday=1&since=${lastDay}`);
+        const delta = await response.json();
+        if (delta.delta && delta.live && delta.players.length === data.players.length) {
+            return mergePerformanceDelta(data, delta);
+        }
+    } catch (error) {
+        console.error('Error loading live prices:', error);
+    }
+    return data;
+}
+
 async function loadPerformanceData() {
     showLoading(true, 'Loading stock data...');
 
     try {
-        const response = await fetch('/api/performance');
-        performanceData = await response.json();
+        performanceData = await fetchPerformanceData();
+        if (!performanceData.error) {
+            performanceData = await withLivePoint(performanceData);
+        }
 
         if (performanceData.error) {
             alert(performanceData.error);
@@ -645,6 +815,22 @@ function updateStandingsAtIndex(index) {
         };
     }).sort((a, b) => b.value - a.value);
 
+    renderStandings(standings);
+}
+
+// Standings for one precomputed replay frame, already ranked by the server
+function updateStandingsFromReplay(replay, frame) {
+    const values = replay.values[frame];
+    renderStandings(replay.ranks[frame].map(i => ({
+        name: replay.players[i].name,
+        color: replay.players[i].color,
+        value: values[i],
+        change: (values[i] - INITIAL_INVESTMENT) / INITIAL_INVESTMENT * 100,
+        index: i
+    })));
+}
+
+function renderStandings(standings) {
     const container = document.getElementById('standings-list');
     container.innerHTML = standings.map((s, i) => {
         const changeClass = s.change >= 0 ? 'positive' : 'negative';
@@ -678,7 +864,7 @@ async function showPlayerModal(playerIndex) {
     showLoading(true, 'Loading player details...');
 
     try {
-        const response = await fetch(`/api/player-details/${playerIndex}`);
+        const response = await fetch(competitionApi(`player-details/${playerIndex}`));
         const data = await response.json();
 
         if (data.error) {
@@ -861,15 +1047,30 @@ function updateRaceDisplay() {
 }
 
 // GIF Export Functions
-function startGifRecording() {
-    const totalDays = performanceData.trading_days.length;
-
-    // Calculate frame skip to stay under MAX_GIF_FRAMES
-    const frameSkip = Math.max(1, Math.ceil(totalDays / MAX_GIF_FRAMES));
+async function fetchReplayFrames(frames) {
+    const response = await fetch(`${competitionApi('replay')}?frames=${frames}&short=${includeShort}`);
+    if (!response.ok) return null;
+    return response.json();
+}
 
+async function startGifRecording() {
     gifRecording = true;
     gifCancelled = false;
     gifFrames = [];
+
+    // The server samples at most MAX_GIF_FRAMES days and ranks each one
+    let replay = null;
+    try {
+        replay = await fetchReplayFrames(MAX_GIF_FRAMES);
+    } catch (error) {
+        console.error('Error loading replay frames:', error);
+    }
+    if (!replay || replay.error) {
+        alert('Failed to load replay frames');
+        resetGifUI();
+        return;
+    }
+
     raceIndex = 0;
     calculateRaceBounds();
 
@@ -886,41 +1087,35 @@ function startGifRecording() {
     }, GIF_TIMEOUT_MS);
 
     // Record frames
-    recordGifFrames(frameSkip, totalDays);
+    recordGifFrames(replay, 0);
 }
 
-function recordGifFrames(frameSkip, totalDays) {
+function recordGifFrames(replay, frame) {
     if (gifCancelled) {
         resetGifUI();
         return;
     }
 
-    if (raceIndex >= totalDays) {
+    if (frame >= replay.frames) {
         finishGifRecording();
         return;
     }
 
-    // Update display
-    updateRaceDisplay();
+    // Step frames land on trading days, so the chart can be cut at the frame's day
+    raceIndex = replay.positions[frame];
+    document.getElementById('race-date').textContent = replay.dates[frame];
+    updateChart();
+    updateStandingsFromReplay(replay, frame);
 
     // Capture frame
     captureGifFrame();
 
     // Update progress
-    const progress = Math.round((raceIndex / totalDays) * 100);
+    const progress = Math.round(((frame + 1) / replay.frames) * 100);
     document.getElementById('gif-progress').textContent = `Recording: ${progress}%`;
 
-    // Move to next frame
-    raceIndex += frameSkip;
-    if (raceIndex >= totalDays) {
-        raceIndex = totalDays - 1;
-        updateRaceDisplay();
-        captureGifFrame();
-        finishGifRecording();
-    } else {
-        // Use setTimeout to prevent blocking
-        setTimeout(() => recordGifFrames(frameSkip, totalDays), 50);
-    }
+    // Use setTimeout to prevent blocking
+    setTimeout(() => recordGifFrames(replay, frame + 1), 50);
 }
 
 function captureGifFrame() {
@@ -1067,7 +1262,7 @@ document.getElementById('save-competition').addEventListener('click', async () =
     showLoading(true, 'Saving competition...');
 
     try {
-        const response = await fetch('/api/competition', {
+        const response = await fetch(competitionApi(), {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify(competition)
@@ -0,0 +1,242 @@
+"""Offline benchmarks for the Cheese Stick API.
+
+Generates a synthetic competition, swaps yfinance and the Yahoo RSS feed
+for deterministic local fakes, and times each endpoint through the Flask
+test client. No network access is needed.
+
+    python benchmark.py --players 200 --positions 5 --years 3
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+# Prices are a random walk from a fixed epoch, so any date range of a
+# symbol comes out the same no matter how it is requested
+PRICE_EPOCH = '2000-01-03'
+
+download_calls = 0
+download_lock = threading.Lock()
+
+def symbol_seed(symbol):
+    return zlib.crc32(symbol.encode('utf-8'))
+
+@lru_cache(maxsize=8)
+def business_days(end):
+    return pd.bdate_range(PRICE_EPOCH, pd.Timestamp(end) - pd.Timedelta(days=1))
+
+def fake_price_series(symbol, end):
+    """Daily closes for symbol from PRICE_EPOCH up to (not including) end."""
+    days = business_days(end)
+    rng = np.random.default_rng(symbol_seed(symbol))
+    start_price = rng.uniform(5, 500)
+    returns = rng.normal(0.0003, 0.02, len(days))
+    return pd.Series(start_price * np.exp(np.cumsum(returns)), index=days)
+
+def fake_download(symbols, start=None, end=None, period=None, interval='1d', **kwargs):
+    """Stand-in for yf.download returning the same frame layout."""
+    global download_calls
+    with download_lock:
+        download_calls += 1
+
+    if isinstance(symbols, str):
+        symbols = symbols.split()
+    symbols = list(symbols)
+
+    if interval != '1d':
+        # One 5-minute session today, wandering around yesterday's close
+        index = pd.date_range(datetime.now().strftime('%Y-%m-%d') + ' 13:30', periods=78, freq='5min', tz='UTC')
+        end = datetime.now().strftime('%Y-%m-%d')
+        closes = {}
+        for symbol in symbols:
+            last = fake_price_series(symbol, end).iloc[-1]
+            rng = np.random.default_rng(symbol_seed(symbol) + 1)
+            closes[symbol] = last * np.exp(np.cumsum(rng.normal(0, 0.002, len(index))))
+    else:
+        closes = {symbol: fake_price_series(symbol, end)[start:] for symbol in symbols}
+        index = next(iter(closes.values())).index if closes else pd.DatetimeIndex([])
+
+    columns = pd.MultiIndex.from_product([['Close'], symbols], names=['Price', 'Ticker'])
+    return pd.DataFrame({('Close', symbol): np.asarray(closes[symbol]) for symbol in symbols}, index=index, columns=columns)
+
+class FakeTicker:
+    """Stand-in for yf.Ticker with just the attributes the server reads."""
+
+    def __init__(self, symbol):
+        self.symbol = symbol
+
+    @property
+    def info(self):
+        return {'previousClose': 100.0} if self.symbol.isalpha() else {}
+
+    @property
+    def news(self):
+        return [
+            {'title': f'{self.symbol} ticker story {i}', 'publisher': 'Fake Wire', 'link': '', 'providerPublishTime': i}
+            for i in range(3)
+        ]
+
+async def fake_rss_news(symbol):
+    return [
+        {'symbol': symbol, 'title': f'{symbol} headline {i}', 'publisher': 'Yahoo Finance', 'link': '', 'published': i}
+        for i in range(5)
+    ]
+
+def make_competition(players, positions, years, universe, seed):
+    rng = random.Random(seed)
+    symbols = [f'S{i:04d}' for i in range(universe)]
+    start = datetime.now() - timedelta(days=int(years * 365))
+    return {
+        'name': 'Benchmark League',
+        'start_date': start.strftime('%Y-%m-%d'),
+        'initial_investment': 20000 * positions,
+        'stock_allocation': 20000,
+        'players': [
+            {
+                'name': f'Player {i}',
+                'color': '#%06x' % rng.randrange(0x1000000),
+                'longs': rng.sample(symbols, positions),
+                'short': rng.choice(symbols)
+            }
+            for i in range(players)
+        ]
+    }
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * pct / 100), len(ordered) - 1)]
+
+def run_case(client, name, url, iterations, concurrency, reset=None):
+    """Time one endpoint, returning a row of results.
+
+    Latency is timed without tracemalloc (it slows Python code down
+    several times over); peak memory comes from a separate short pass.
+    """
+    def one_request():
+        if reset:
+            reset()
+        started = time.perf_counter()
+        response = client.get(url, headers={'Accept-Encoding': 'gzip'})
+        elapsed = time.perf_counter() - started
+        if response.status_code not in (200, 304):
+            raise RuntimeError(f"{url} returned {response.status_code}: {response.get_data(as_text=True)[:200]}")
+        return elapsed, len(response.get_data())
+
+    started = time.perf_counter()
+    if concurrency > 1:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(lambda _: one_request(), range(iterations)))
+    else:
+        results = [one_request() for _ in range(iterations)]
+    wall = time.perf_counter() - started
+
+    tracemalloc.start()
+    for _ in range(min(iterations, 3)):
+        one_request()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    latencies = [elapsed * 1000 for elapsed, _ in results]
+    return {
+        'name': name,
+        'url': url,
+        'requests': iterations,
+        'p50_ms': percentile(latencies, 50),
+        'p90_ms': percentile(latencies, 90),
+        'p99_ms': percentile(latencies, 99),
+        'mean_ms': statistics.mean(latencies),
+        'rps': iterations / wall,
+        'peak_mb': peak / 1024 / 1024,
+        'bytes': results[-1][1]
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--players', type=int, default=50)
+    parser.add_argument('--positions', type=int, default=5, help='long positions per player (plus one short)')
+    parser.add_argument('--years', type=float, default=1.0, help='years of price history')
+    parser.add_argument('--universe', type=int, default=None, help='distinct symbols (default: players x positions / 2)')
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--json', help='also write results to this file')
+    args = parser.parse_args()
+
+    universe = args.universe or max(args.players * args.positions // 2, args.positions + 1)
+    workdir = tempfile.mkdtemp(prefix='cheese-stick-bench-')
+
+    # Point the server at scratch files and no MongoDB before importing it
+    os.environ.pop('MONGODB_URI', None)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import server
+    import yfinance
+
+    server.COMPETITION_FILE = os.path.join(workdir, 'competition.json')
+    server.CACHE_DIR = os.path.join(workdir, 'price_cache')
+    yfinance.download = fake_download
+    yfinance.Ticker = FakeTicker
+    server.fetch_yahoo_rss_news = fake_rss_news
+
+    competition = make_competition(args.players, args.positions, args.years, universe, args.seed)
+    with open(server.COMPETITION_FILE, 'w') as f:
+        json.dump(competition, f)
+
+    def reset_analytics():
+        server.analytics_snapshots.clear()
+
+    def reset_news():
+        server.news_cache.clear()
+
+    client = server.app.test_client()
+    news_symbols = ','.join(competition['players'][0]['longs'] + [competition['players'][0]['short']])
+    player_count = len(competition['players'])
+
+    print(f"Synthetic league: {args.players} players x {args.positions} longs + 1 short, "
+          f"{universe} symbols, {args.years:g} years from {competition['start_date']}")
+
+    started = time.perf_counter()
+    client.get('/api/performance')
+    print(f"Cold start (download + analytics): {(time.perf_counter() - started) * 1000:.1f} ms, "
+          f"{download_calls} download call(s)")
+
+    cases = [
+        ('performance (recompute)', '/api/performance', reset_analytics),
+        ('performance', '/api/performance', None),
+        ('performance columnar', '/api/performance?format=columnar', None),
+        ('performance points=200', '/api/performance?points=200', None),
+        ('stock-details', '/api/stock-details', None),
+        ('risk', '/api/risk', None),
+        ('replay', '/api/replay?frames=300&interpolation=linear', None),
+        ('player-details (recompute)', f'/api/player-details/{player_count - 1}', reset_analytics),
+        ('player-details', f'/api/player-details/{player_count - 1}', None),
+        ('news (uncached)', f'/api/news/{news_symbols}', reset_news),
+        ('news', f'/api/news/{news_symbols}', None),
+    ]
+
+    rows = [run_case(client, name, url, args.iterations, args.concurrency, reset) for name, url, reset in cases]
+
+    print()
+    print(f"{'endpoint':<28}{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}{'req/s':>10}{'peak MB':>9}{'bytes':>10}")
+    for row in rows:
+        print(f"{row['name']:<28}{row['p50_ms']:>9.2f}{row['p90_ms']:>9.2f}{row['p99_ms']:>9.2f}"
+              f"{row['rps']:>10.1f}{row['peak_mb']:>9.2f}{row['bytes']:>10}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'args': vars(args), 'universe': universe, 'results': rows}, f, indent=2)
+
+if __name__ == '__main__':
+    main()
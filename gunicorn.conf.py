@@ -0,0 +1,25 @@
+"""Gunicorn settings, picked up automatically from the working directory.
+
+PRELOAD=true imports the app once in the master and warms its caches
+before forking, so workers boot instantly and share that memory
+copy-on-write instead of each loading and downloading their own.
+"""
+import gc
+import os
+
+preload_app = os.environ.get('PRELOAD', 'false').lower() == 'true'
+
+# Threaded workers: a request waiting on Yahoo (or holding a leaderboard
+# stream) ties up one thread, not the whole worker, so cached routes keep
+# answering. Upstream calls themselves share each worker's event loop.
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+
+def when_ready(arbiter):
+    if not preload_app:
+        return
+    import server
+    server.warm_caches()
+    # Keep the garbage collector from touching (and so copying) the
+    # warmed objects in every worker
+    gc.freeze()
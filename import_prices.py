@@ -0,0 +1,101 @@
+"""Bulk-load historical closes into the price store (flat .npy arrays).
+
+Reads CSV or Parquet files in any of these layouts:
+
+    long      symbol, date, close columns (one row per symbol per day)
+    wide      a date column plus one column of closes per symbol
+    single    a Yahoo-style export (Date, Close / Adj Close, ...) named
+              after its symbol, e.g. AAPL.csv
+
+and merges them into PRICE_STORE_DIR, which the server reads before asking
+the price provider for anything.
+
+    python import_prices.py history/*.csv --store price_store
+"""
+import argparse
+import os
+import sys
+
+import pandas as pd
+
+SYMBOL_COLUMNS = ('symbol', 'ticker')
+CLOSE_COLUMNS = ('adj close', 'adj_close', 'adjclose', 'close')
+
+def read_table(path):
+    if path.lower().endswith(('.parquet', '.pq')):
+        return pd.read_parquet(path)
+    return pd.read_csv(path)
+
+def find_column(frame, names):
+    columns = {str(column).strip().lower(): column for column in frame.columns}
+    for name in names:
+        if name in columns:
+            return columns[name]
+    return None
+
+def parse_file(path):
+    """Return {symbol: {date: close}} from one file."""
+    frame = read_table(path)
+    date_column = find_column(frame, ('date', 'datetime', 'timestamp'))
+    if date_column is None:
+        if not isinstance(frame.index, pd.DatetimeIndex):
+            raise ValueError(f"{path}: no date column")
+        frame = frame.reset_index()
+        date_column = frame.columns[0]
+
+    frame[date_column] = pd.to_datetime(frame[date_column]).dt.strftime('%Y-%m-%d')
+    symbol_column = find_column(frame, SYMBOL_COLUMNS)
+    close_column = find_column(frame, CLOSE_COLUMNS)
+
+    if symbol_column is not None and close_column is not None:
+        frames = {symbol: rows for symbol, rows in frame.groupby(symbol_column)}
+        columns = {symbol: close_column for symbol in frames}
+    elif close_column is not None:
+        symbol = os.path.splitext(os.path.basename(path))[0]
+        frames = {symbol: frame}
+        columns = {symbol: close_column}
+    else:
+        value_columns = [column for column in frame.columns if column != date_column]
+        frames = {str(column): frame for column in value_columns}
+        columns = {str(column): column for column in value_columns}
+
+    series = {}
+    for symbol, rows in frames.items():
+        closes = pd.to_numeric(rows[columns[symbol]], errors='coerce')
+        valid = closes.notna()
+        series[str(symbol).strip().upper()] = dict(zip(rows[date_column][valid], closes[valid].astype(float)))
+    return series
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('files', nargs='+', help='CSV or Parquet files')
+    parser.add_argument('--store', help='price store directory (default: PRICE_STORE_DIR or price_store)')
+    parser.add_argument('--replace', action='store_true', help='drop symbols already in the store')
+    args = parser.parse_args()
+
+    if args.store:
+        os.environ['PRICE_STORE_DIR'] = args.store
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import server
+
+    series = {}
+    if not args.replace:
+        store = server.open_price_store()
+        if store:
+            series = {symbol: entry['prices'] for symbol, entry in server.read_price_store(store['symbols']).items()}
+
+    for path in args.files:
+        try:
+            imported = parse_file(path)
+        except ImportError as e:  # Parquet needs pyarrow or fastparquet
+            sys.exit(f"{path}: {e}")
+        for symbol, closes in imported.items():
+            series.setdefault(symbol, {}).update(closes)
+        print(f"{path}: {len(imported)} symbol(s), {sum(len(closes) for closes in imported.values())} closes")
+
+    server.write_price_store(series)
+    print(f"Price store {server.PRICE_STORE_DIR}: {len(series)} symbols, "
+          f"{sum(len(closes) for closes in series.values())} closes")
+
+if __name__ == '__main__':
+    main()
@@ -1,59 +1,507 @@
-from flask import Flask, jsonify, request, send_from_directory, session
-import yfinance as yf
+from flask import Flask, g, has_request_context, jsonify, request, send_from_directory, session
+import numpy as np
+import asyncio
 import json
 import os
-import urllib.request
+import re
+import gzip
+import hashlib
+import importlib
+import multiprocessing
+import tempfile
+import threading
+import time
 import xml.etree.ElementTree as ET
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime, timedelta
+from urllib.parse import quote, unquote
+from zoneinfo import ZoneInfo
 import secrets
 
+try:
+    import fcntl
+except ImportError:  # Windows - cross-process cache locking is skipped
+    fcntl = None
+
+try:
+    import brotli
+except ImportError:  # Optional - responses fall back to gzip
+    brotli = None
+
 app = Flask(__name__, static_folder='.')
 app.secret_key = os.environ.get('SECRET_KEY', secrets.token_hex(32))
 
 # Admin password - set via environment variable or defaults to 'cheesestick'
 ADMIN_PASSWORD = os.environ.get('ADMIN_PASSWORD', 'cheesestick')
 
-# MongoDB setup (optional - falls back to JSON file if not configured)
+# MongoDB setup (optional - falls back to JSON file if not configured).
+# yfinance (and pandas with it) and pymongo are imported on first use, so
+# workers boot without paying for them.
 MONGODB_URI = os.environ.get('MONGODB_URI')
-db = None
+mongo_state = {'pid': None, 'db': None}
+mongo_lock = threading.Lock()
 
-if MONGODB_URI:
+COMPETITION_FILE = 'competition.json'
+COMPETITIONS_DIR = 'competitions'
+CACHE_DIR = 'price_cache'
+
+# Competitions are addressed by id; the original single competition is
+# 'main' and keeps its competition.json file and MongoDB document
+DEFAULT_COMPETITION_ID = 'main'
+COMPETITION_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+# In-memory competition configs; other workers' saves are noticed through
+# competition_source_stamp()
+COMPETITION_VERSION_CHECK_SECONDS = float(os.environ.get('COMPETITION_VERSION_CHECK_SECONDS', 5))
+competition_cache = {}  # competition id -> {'data', 'version', 'stamp', 'checked'}
+competition_cache_lock = threading.Lock()
+
+# Optional background refresh of prices and precomputed payloads
+BACKGROUND_REFRESH = os.environ.get('BACKGROUND_REFRESH', 'false').lower() == 'true'
+REFRESH_INTERVAL_SECONDS = int(os.environ.get('REFRESH_INTERVAL_SECONDS', 300))
+MARKET_TIMEZONE = ZoneInfo('America/New_York')
+refresher_pid = None
+
+# News is fetched in parallel and cached per symbol. Symbols come straight
+# from the URL, so the cache keeps at most NEWS_CACHE_MAX_SYMBOLS of them.
+NEWS_CACHE_TTL_SECONDS = int(os.environ.get('NEWS_CACHE_TTL_SECONDS', 600))
+NEWS_CACHE_MAX_SYMBOLS = int(os.environ.get('NEWS_CACHE_MAX_SYMBOLS', 1000))
+NEWS_DEADLINE_SECONDS = float(os.environ.get('NEWS_DEADLINE_SECONDS', 6))
+news_cache = OrderedDict()  # symbol -> (expires_at, items), least recently used first
+news_cache_lock = threading.Lock()
+
+# Symbol validation results are cached; bad symbols are rechecked sooner.
+# Symbols are user input, so at most SYMBOL_VALIDATION_CACHE_MAX are kept.
+SYMBOL_VALID_TTL_SECONDS = int(os.environ.get('SYMBOL_VALID_TTL_SECONDS', 86400))
+SYMBOL_INVALID_TTL_SECONDS = int(os.environ.get('SYMBOL_INVALID_TTL_SECONDS', 3600))
+SYMBOL_VALIDATION_CACHE_MAX = int(os.environ.get('SYMBOL_VALIDATION_CACHE_MAX', 5000))
+MAX_VALIDATE_SYMBOLS = 60
+symbol_validation_cache = OrderedDict()  # symbol -> (expires_at, valid), least recently used first
+symbol_validation_lock = threading.Lock()
+
+# Upstream I/O (news, symbol validation, price downloads) runs on one
+# asyncio event loop per worker with a pooled HTTP client, so many slow
+# Yahoo calls overlap instead of each holding a thread. yfinance itself is
+# blocking and runs in the loop's executor, UPSTREAM_CONCURRENCY at a time.
+UPSTREAM_CONCURRENCY = int(os.environ.get('UPSTREAM_CONCURRENCY', 16))
+UPSTREAM_TIMEOUT_SECONDS = float(os.environ.get('UPSTREAM_TIMEOUT_SECONDS', 5))
+upstream_state = {'pid': None, 'loop': None, 'client': None, 'slots': None, 'tasks': set()}
+upstream_lock = threading.Lock()
+
+# Circuit breakers around flaky upstreams: after CIRCUIT_FAILURES failures
+# in a row calls fail fast for a backoff that doubles on every further
+# failure (up to CIRCUIT_MAX_BACKOFF_SECONDS), then one trial call is let
+# through. Analytics fall back to the last known good prices meanwhile.
+CIRCUIT_FAILURES = int(os.environ.get('CIRCUIT_FAILURES', 3))
+CIRCUIT_BACKOFF_SECONDS = float(os.environ.get('CIRCUIT_BACKOFF_SECONDS', 5))
+CIRCUIT_MAX_BACKOFF_SECONDS = float(os.environ.get('CIRCUIT_MAX_BACKOFF_SECONDS', 300))
+circuits = {}  # upstream -> {'failures', 'open_until', 'probing'}
+circuit_lock = threading.Lock()
+revalidating = set()  # competition ids with a background revalidation running
+
+# JSON responses at least this large are gzip/brotli compressed
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', 1024))
+
+# Optional intraday bars for a live "today" point
+INTRADAY_INTERVAL = os.environ.get('INTRADAY_INTERVAL', '5m')
+INTRADAY_TTL_SECONDS = int(os.environ.get('INTRADAY_TTL_SECONDS', 60))
+intraday_cache = {}  # sorted symbols -> (expires_at, bars)
+intraday_locks = {}  # sorted symbols -> lock held while downloading them
+intraday_lock = threading.Lock()
+
+# Risk analytics: rolling volatility window and the annual risk-free rate
+# used for Sharpe ratios
+RISK_WINDOW_DAYS = max(int(os.environ.get('RISK_WINDOW_DAYS', 20)), 2)
+RISK_FREE_RATE = float(os.environ.get('RISK_FREE_RATE', 0.0))
+TRADING_DAYS_PER_YEAR = 252
+risk_states = {}  # competition id -> running risk statistics
+
+# What-if backtests: batches of at least BACKTEST_PARALLEL_MIN_VARIANTS are
+# split across a pool of BACKTEST_PROCESSES processes
+MAX_BACKTEST_VARIANTS = int(os.environ.get('MAX_BACKTEST_VARIANTS', 20000))
+MAX_BACKTEST_SYMBOLS = int(os.environ.get('MAX_BACKTEST_SYMBOLS', 100))
+# Backtests are anonymous, so they can't reach further back than this before
+# the competition start (and pull whole histories into the shared cache)
+BACKTEST_MAX_LOOKBACK_DAYS = int(os.environ.get('BACKTEST_MAX_LOOKBACK_DAYS', 365))
+BACKTEST_CHUNK_VARIANTS = 1000
+BACKTEST_PARALLEL_MIN_VARIANTS = int(os.environ.get('BACKTEST_PARALLEL_MIN_VARIANTS', 4000))
+BACKTEST_PROCESSES = int(os.environ.get('BACKTEST_PROCESSES', os.cpu_count() or 1))
+backtest_state = {'pid': None, 'pool': None}
+backtest_lock = threading.Lock()
+
+# Metrics for /metrics (per worker) and the optional Server-Timing header
+SERVER_TIMING = os.environ.get('SERVER_TIMING', 'false').lower() == 'true'
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+METRICS = {
+    'cheesestick_http_request_seconds': ('histogram', 'Request latency by route'),
+    'cheesestick_stage_seconds': ('histogram', 'Time spent in hot-path stages'),
+    'cheesestick_upstream_seconds': ('histogram', 'Upstream call latency by provider'),
+    'cheesestick_upstream_requests_total': ('counter', 'Upstream calls by provider and outcome'),
+    'cheesestick_cache_requests_total': ('counter', 'Cache lookups by cache and result')
+}
+metric_values = {}  # (name, labels) -> number, or histogram dict
+metrics_lock = threading.Lock()
+process_started = time.time()
+
+# Price cache limits - least recently used symbols are evicted first
+PRICE_CACHE_MAX_SYMBOLS = int(os.environ.get('PRICE_CACHE_MAX_SYMBOLS', 500))
+PRICE_CACHE_MAX_AGE_DAYS = float(os.environ.get('PRICE_CACHE_MAX_AGE_DAYS', 30))
+
+# Adjusted closes are restated after splits and dividends, so each tail
+# fetch also downloads the last covered day. If its close moved by more than
+# this fraction, the symbol's whole range is downloaded again.
+PRICE_RESTATE_TOLERANCE = 1e-4
+
+# In-process price cache: symbol -> {'start', 'end', 'prices', 'used', 'basis'},
+# backed by MongoDB when configured (shared by every worker and instance),
+# otherwise by one gzipped file per symbol in CACHE_DIR. 'basis' is when the
+# series was last downloaded in full after a restatement (0 if never).
+price_cache = OrderedDict()
+price_cache_lock = threading.RLock()
+price_cache_pins = {}  # symbol -> number of load_prices calls still using it
+price_cache_loaded = False
+price_indexes_ready = False
+
+# Daily closes come from PRICE_PROVIDER: a name in PRICE_PROVIDERS or a
+# 'module:function' taking (symbols, start_date, end_date)
+PRICE_PROVIDER = os.environ.get('PRICE_PROVIDER', 'yfinance')
+
+# Optional read-only store of imported closes (see import_prices.py). The
+# arrays are opened with mmap so a worker only reads the slices it needs,
+# but each symbol it touches is still copied into its own price_cache
+PRICE_STORE_DIR = os.environ.get('PRICE_STORE_DIR', 'price_store')
+price_store = {'stamp': None, 'symbols': {}, 'days': None, 'closes': None}
+price_store_lock = threading.Lock()
+market_holiday_cache = {}  # year -> set of NYSE holiday dates
+
+# Downloads are split into PRICE_BATCH_CONCURRENCY stripes of symbols and
+# each stripe into batches of PRICE_BATCH_SIZE symbols, with at most
+# PRICE_BATCH_CONCURRENCY in flight and PRICE_REQUESTS_PER_SECOND started per
+# second. Symbols from a batch that failed are retried in half-size batches
+# (isolating a bad ticker) after an exponential backoff, all within a budget
+# of PRICE_REQUEST_BUDGET provider calls per fetch.
+PRICE_BATCH_SIZE = max(int(os.environ.get('PRICE_BATCH_SIZE', 50)), 1)
+PRICE_BATCH_CONCURRENCY = max(int(os.environ.get('PRICE_BATCH_CONCURRENCY', 4)), 1)
+PRICE_REQUESTS_PER_SECOND = float(os.environ.get('PRICE_REQUESTS_PER_SECOND', 4))
+PRICE_REQUEST_BUDGET = int(os.environ.get('PRICE_REQUEST_BUDGET', 100))
+PRICE_RETRIES = int(os.environ.get('PRICE_RETRIES', 2))
+PRICE_RETRY_BACKOFF_SECONDS = float(os.environ.get('PRICE_RETRY_BACKOFF_SECONDS', 1))
+price_pacing = {'next': 0.0}  # when the next batch may start; only used on the upstream loop
+
+# A symbol that comes back empty while its batch-mates have closes (how
+# yfinance reports a ticker it couldn't fetch) is retried on its own backoff,
+# PRICE_EMPTY_RETRY_SECONDS doubling per try, without marking results stale.
+# After PRICE_EMPTY_ATTEMPTS empty answers the range is taken as empty.
+PRICE_EMPTY_ATTEMPTS = max(int(os.environ.get('PRICE_EMPTY_ATTEMPTS', 3)), 1)
+PRICE_EMPTY_RETRY_SECONDS = float(os.environ.get('PRICE_EMPTY_RETRY_SECONDS', 60))
+price_empty_symbols = {}  # symbol -> {'attempts', 'retry_at'}; guarded by price_cache_lock
+
+# Upstream downloads of the same date range and symbol stripe are serialized
+# through one of these locks (and a matching lock file across workers), so
+# concurrent requests wait for the first fetch instead of repeating it
+PRICE_FETCH_LOCK_STRIPES = 16
+price_fetch_locks = [threading.Lock() for _ in range(PRICE_FETCH_LOCK_STRIPES)]
+
+def mongo():
+    """The MongoDB database, or None when MONGODB_URI isn't set or can't connect.
+
+    The client is created on first use in each process; MongoClient isn't
+    fork-safe, so one made in the gunicorn master is never reused by workers.
+    """
+    if not MONGODB_URI:
+        return None
+    if mongo_state['pid'] != os.getpid():
+        with mongo_lock:
+            if mongo_state['pid'] != os.getpid():
+                try:
+                    from pymongo import MongoClient
+                    mongo_state['db'] = MongoClient(MONGODB_URI).cheesestick
+                    print("Connected to MongoDB")
+                except Exception as e:
+                    print(f"MongoDB connection failed: {e}")
+                    mongo_state['db'] = None
+                mongo_state['pid'] = os.getpid()
+    return mongo_state['db']
+
+def count_metric(name, amount=1, **labels):
+    key = (name, tuple(sorted(labels.items())))
+    with metrics_lock:
+        metric_values[key] = metric_values.get(key, 0) + amount
+
+def observe_metric(name, seconds, **labels):
+    key = (name, tuple(sorted(labels.items())))
+    with metrics_lock:
+        histogram = metric_values.get(key)
+        if histogram is None:
+            histogram = metric_values[key] = {'buckets': [0] * len(LATENCY_BUCKETS), 'sum': 0.0, 'count': 0}
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                histogram['buckets'][i] += 1
+        histogram['sum'] += seconds
+        histogram['count'] += 1
+
+def count_cache(cache, hit):
+    count_metric('cheesestick_cache_requests_total', cache=cache, result='hit' if hit else 'miss')
+
+def remember(cache, key, expires_at, value, max_entries):
+    """Store (expires_at, value) in an LRU OrderedDict, under the caller's lock.
+
+    Expired entries are dropped first, then the least recently used ones
+    until at most max_entries remain.
+    """
+    now = time.time()
+    for expired in [k for k, (expires, _) in cache.items() if expires <= now]:
+        del cache[expired]
+    cache[key] = (expires_at, value)
+    cache.move_to_end(key)
+    while len(cache) > max_entries:
+        cache.popitem(last=False)
+
+def record_server_timing(name, seconds):
+    if SERVER_TIMING and has_request_context():
+        timings = g.setdefault('server_timing', {})
+        timings[name] = timings.get(name, 0) + seconds
+
+@contextmanager
+def timed(stage):
+    """Time a hot-path stage for /metrics and Server-Timing."""
+    started = time.perf_counter()
     try:
-        from pymongo import MongoClient
-        client = MongoClient(MONGODB_URI)
-        db = client.cheesestick
-        print("Connected to MongoDB")
-    except Exception as e:
-        print(f"MongoDB connection failed: {e}")
-        db = None
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        observe_metric('cheesestick_stage_seconds', elapsed, stage=stage)
+        record_server_timing(stage, elapsed)
+
+@contextmanager
+def upstream_call(provider):
+    """Count and time a call to an upstream provider."""
+    started = time.perf_counter()
+    outcome = 'error'
+    try:
+        yield
+        outcome = 'ok'
+    finally:
+        elapsed = time.perf_counter() - started
+        count_metric('cheesestick_upstream_requests_total', provider=provider, outcome=outcome)
+        observe_metric('cheesestick_upstream_seconds', elapsed, provider=provider)
+        record_server_timing(provider, elapsed)
+
+class UpstreamUnavailable(Exception):
+    """Raised instead of calling an upstream whose circuit is open."""
+
+def circuit_allows(name):
+    """Whether a call to upstream `name` may go ahead.
+
+    While the circuit is open calls are refused; once the backoff has passed
+    a single trial call is allowed until its result is recorded.
+    """
+    with circuit_lock:
+        state = circuits.setdefault(name, {'failures': 0, 'open_until': 0, 'probing': False})
+        if state['failures'] < CIRCUIT_FAILURES:
+            return True
+        if state['probing'] or time.time() < state['open_until']:
+            count_metric('cheesestick_upstream_requests_total', provider=name, outcome='short_circuit')
+            return False
+        state['probing'] = True
+        return True
+
+def record_circuit(name, ok):
+    """Record the outcome of a call allowed by circuit_allows."""
+    with circuit_lock:
+        state = circuits.setdefault(name, {'failures': 0, 'open_until': 0, 'probing': False})
+        state['probing'] = False
+        if ok:
+            if state['failures'] >= CIRCUIT_FAILURES:
+                print(f"{name} circuit closed")
+            state['failures'] = 0
+            return
+        state['failures'] += 1
+        if state['failures'] >= CIRCUIT_FAILURES:
+            backoff = min(CIRCUIT_BACKOFF_SECONDS * 2 ** (state['failures'] - CIRCUIT_FAILURES), CIRCUIT_MAX_BACKOFF_SECONDS)
+            state['open_until'] = time.time() + backoff
+            print(f"{name} circuit open for {backoff:.0f}s after {state['failures']} failures")
+
+def circuit_retry_in(name):
+    """Seconds until upstream `name` will accept a call again."""
+    with circuit_lock:
+        state = circuits.get(name)
+        if state is None or state['failures'] < CIRCUIT_FAILURES:
+            return 0
+        return max(state['open_until'] - time.time(), 0)
+
+def upstream_loop():
+    """This process's upstream event loop, started on first use (and again after a fork)."""
+    if upstream_state['pid'] != os.getpid():
+        with upstream_lock:
+            if upstream_state['pid'] != os.getpid():
+                loop = asyncio.new_event_loop()
+                loop.set_default_executor(ThreadPoolExecutor(max_workers=UPSTREAM_CONCURRENCY, thread_name_prefix='upstream'))
+                threading.Thread(target=loop.run_forever, name='upstream-loop', daemon=True).start()
+                upstream_state.update(
+                    pid=os.getpid(), loop=loop, client=None,
+                    slots=asyncio.Semaphore(UPSTREAM_CONCURRENCY), tasks=set()
+                )
+    return upstream_state['loop']
+
+def run_upstream(coro, timeout=None):
+    """Run a coroutine on the upstream loop, blocking the calling thread for its result."""
+    return asyncio.run_coroutine_threadsafe(coro, upstream_loop()).result(timeout)
+
+def http_client():
+    """Pooled async HTTP client; only used from the upstream loop."""
+    if upstream_state['client'] is None:
+        import httpx
+
+        upstream_state['client'] = httpx.AsyncClient(
+            timeout=UPSTREAM_TIMEOUT_SECONDS,
+            headers={'User-Agent': 'Mozilla/5.0'},
+            limits=httpx.Limits(max_connections=UPSTREAM_CONCURRENCY, max_keepalive_connections=UPSTREAM_CONCURRENCY)
+        )
+    return upstream_state['client']
+
+async def in_thread(func, *args):
+    """Run a blocking upstream call (yfinance) in the loop's executor."""
+    async with upstream_state['slots']:
+        return await asyncio.to_thread(func, *args)
+
+def keep_running(task):
+    """Hold a reference to a task left running past its caller's deadline."""
+    upstream_state['tasks'].add(task)
+    task.add_done_callback(upstream_state['tasks'].discard)
+
+def competition_hash(data):
+    """Content hash used as the competition's version and ETag."""
+    content = json.dumps(data, sort_keys=True, separators=(',', ':')).encode('utf-8')
+    return hashlib.sha1(content).hexdigest()[:16]
+
+def competition_file(competition_id):
+    """JSON file holding a competition when MongoDB isn't configured."""
+    if competition_id == DEFAULT_COMPETITION_ID:
+        return COMPETITION_FILE
+    return os.path.join(COMPETITIONS_DIR, f"{competition_id}.json")
+
+def competition_source_stamp(competition_id=DEFAULT_COMPETITION_ID):
+    """Cheaply identify the stored competition without loading it."""
+    if mongo() is not None:
+        try:
+            doc = mongo().competition.find_one({'_id': competition_id}, {'_version': 1})
+            if doc:
+                return ('mongodb', doc.get('_version'))
+        except Exception as e:
+            print(f"MongoDB version check error: {e}")
 
-COMPETITION_FILE = 'competition.json'
-CACHE_FILE = 'price_cache.json'
+    try:
+        stat = os.stat(competition_file(competition_id))
+        return ('file', stat.st_mtime_ns, stat.st_size)
+    except OSError:
+        return None
 
-def load_competition():
+def read_competition(competition_id=DEFAULT_COMPETITION_ID):
     # Try MongoDB first
-    if db is not None:
+    if mongo() is not None:
         try:
-            doc = db.competition.find_one({'_id': 'main'})
+            doc = mongo().competition.find_one({'_id': competition_id})
             if doc:
                 doc.pop('_id', None)
+                doc.pop('_version', None)
                 return doc
         except Exception as e:
             print(f"MongoDB load error: {e}")
 
     # Fall back to JSON file
-    if os.path.exists(COMPETITION_FILE):
-        with open(COMPETITION_FILE, 'r') as f:
+    path = competition_file(competition_id)
+    if os.path.exists(path):
+        with open(path, 'r') as f:
             return json.load(f)
     return None
 
-def save_competition(data):
+def load_competition_versioned(competition_id=DEFAULT_COMPETITION_ID):
+    """Return (competition, version), served from memory while unchanged.
+
+    The stored copy is re-checked through competition_source_stamp() - on
+    every call for the JSON file, and at most every
+    COMPETITION_VERSION_CHECK_SECONDS for MongoDB.
+    """
+    if not COMPETITION_ID_PATTERN.match(competition_id):
+        return None, None
+
+    now = time.time()
+    with competition_cache_lock:
+        cached = dict(competition_cache.get(competition_id) or {})
+    if cached and mongo() is not None and now - cached['checked'] < COMPETITION_VERSION_CHECK_SECONDS:
+        count_cache('competition', True)
+        return cached['data'], cached['version']
+
+    stamp = competition_source_stamp(competition_id)
+    if cached and stamp == cached['stamp']:
+        with competition_cache_lock:
+            competition_cache[competition_id]['checked'] = now
+        count_cache('competition', True)
+        return cached['data'], cached['version']
+
+    count_cache('competition', False)
+    with timed('load_competition'):
+        data = read_competition(competition_id)
+    version = competition_hash(data) if data else None
+    # Unknown ids aren't remembered, so made-up ids can't grow the cache
+    if data or competition_id == DEFAULT_COMPETITION_ID:
+        with competition_cache_lock:
+            competition_cache[competition_id] = {'data': data, 'version': version, 'stamp': stamp, 'checked': now}
+    return data, version
+
+def load_competition(competition_id=DEFAULT_COMPETITION_ID):
+    return load_competition_versioned(competition_id)[0]
+
+def invalidate_competition_cache(competition_id=DEFAULT_COMPETITION_ID):
+    with competition_cache_lock:
+        competition_cache.pop(competition_id, None)
+
+def list_competition_ids():
+    """Ids of every stored competition."""
+    if mongo() is not None:
+        try:
+            return sorted(doc['_id'] for doc in mongo().competition.find({}, {'_id': 1}))
+        except Exception as e:
+            print(f"MongoDB list error: {e}")
+
+    ids = [DEFAULT_COMPETITION_ID] if os.path.exists(COMPETITION_FILE) else []
+    if os.path.isdir(COMPETITIONS_DIR):
+        for name in sorted(os.listdir(COMPETITIONS_DIR)):
+            competition_id = name[:-len('.json')]
+            if name.endswith('.json') and COMPETITION_ID_PATTERN.match(competition_id) and competition_id not in ids:
+                ids.append(competition_id)
+    return ids
+
+def load_competitions():
+    """Return {competition id: (competition, version)} for every stored competition."""
+    competitions = {}
+    for competition_id in list_competition_ids():
+        competition, version = load_competition_versioned(competition_id)
+        if competition and competition.get('players'):
+            competitions[competition_id] = (competition, version)
+    return competitions
+
+def symbol_competition_index(competitions):
+    """Map each symbol to the ids of the competitions holding it."""
+    index = {}
+    for competition_id, (competition, _) in competitions.items():
+        for symbol in competition_symbols(competition):
+            index.setdefault(symbol, []).append(competition_id)
+    return index
+
+def save_competition(data, competition_id=DEFAULT_COMPETITION_ID):
+    invalidate_competition_cache(competition_id)
+
     # Try MongoDB first
-    if db is not None:
+    if mongo() is not None:
         try:
-            db.competition.replace_one(
-                {'_id': 'main'},
-                {**data, '_id': 'main'},
+            mongo().competition.replace_one(
+                {'_id': competition_id},
+                {**data, '_id': competition_id, '_version': competition_hash(data)},
                 upsert=True
             )
             print("Saved to MongoDB")
@@ -62,83 +510,1071 @@ def save_competition(data):
             print(f"MongoDB save error: {e}")
 
     # Fall back to JSON file
-    with open(COMPETITION_FILE, 'w') as f:
+    path = competition_file(competition_id)
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
         json.dump(data, f, indent=2)
 
-def load_cache():
-    if os.path.exists(CACHE_FILE):
-        with open(CACHE_FILE, 'r') as f:
-            return json.load(f)
-    return {}
+def price_cache_path(symbol):
+    return os.path.join(CACHE_DIR, quote(symbol, safe='') + '.json.gz')
 
-def save_cache(cache):
-    with open(CACHE_FILE, 'w') as f:
-        json.dump(cache, f)
+def read_price_cache_file(symbol):
+    """Read one symbol's entry from the on-disk price cache, or None."""
+    try:
+        with gzip.open(price_cache_path(symbol), 'rt') as f:
+            item = json.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"Price cache read error for {symbol}: {e}")
+        return None
+    return {
+        'start': item['start'],
+        'end': item['end'],
+        'prices': dict(zip(item['dates'], item['closes'])),
+        'used': item.get('used', 0),
+        'basis': item.get('basis', 0)
+    }
+
+def read_price_cache_files(symbols=None):
+    """Read the on-disk price cache into {symbol: entry}, for symbols or all of it."""
+    if symbols is None:
+        try:
+            names = os.listdir(CACHE_DIR)
+        except FileNotFoundError:
+            return {}
+        symbols = [unquote(name[:-len('.json.gz')]) for name in names if name.endswith('.json.gz')]
+
+    entries = {}
+    with timed('price_cache_read'):
+        for symbol in symbols:
+            entry = read_price_cache_file(symbol)
+            if entry is not None:
+                entries[symbol] = entry
+    return entries
+
+def write_price_cache_files(entries):
+    """Atomically replace the files of the given symbols in the on-disk price cache."""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    for symbol, entry in entries.items():
+        dates = sorted(entry['prices'])
+        data = {
+            'start': entry['start'],
+            'end': entry['end'],
+            'used': entry['used'],
+            'basis': entry.get('basis', 0),
+            'dates': dates,
+            'closes': [entry['prices'][day] for day in dates]
+        }
 
-def get_stock_data(symbols, start_date, end_date=None):
-    """Fetch adjusted close prices for symbols from start_date to end_date."""
-    if end_date is None:
-        end_date = datetime.now().strftime('%Y-%m-%d')
+        # Write to a temp file in the same directory, then rename over the
+        # old one so readers never see a half-written entry
+        fd, tmp_path = tempfile.mkstemp(dir=CACHE_DIR, prefix='.price_cache.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb') as f:
+                f.write(json.dumps(data, separators=(',', ':')).encode('utf-8'))
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, price_cache_path(symbol))
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+
+def prune_price_cache_files():
+    """Delete cached symbols nobody has refreshed in PRICE_CACHE_MAX_AGE_DAYS."""
+    cutoff = time.time() - PRICE_CACHE_MAX_AGE_DAYS * 86400
+    try:
+        names = os.listdir(CACHE_DIR)
+    except FileNotFoundError:
+        return
+    for name in names:
+        path = os.path.join(CACHE_DIR, name)
+        try:
+            if name.endswith('.json.gz') and os.path.getmtime(path) < cutoff:
+                os.unlink(path)
+        except OSError:
+            pass
 
-    cache = load_cache()
-    cache_key = f"{','.join(sorted(symbols))}_{start_date}_{end_date}"
-    today = datetime.now().strftime('%Y-%m-%d')
+def open_price_store():
+    """Memory-map the imported price store, reopening it after a new import."""
+    try:
+        stat = os.stat(os.path.join(PRICE_STORE_DIR, 'index.json'))
+    except OSError:
+        return None
 
-    # Use cache if not today's data
-    if cache_key in cache and end_date != today:
-        return cache[cache_key]
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    with price_store_lock:
+        if price_store['stamp'] != stamp:
+            try:
+                with open(os.path.join(PRICE_STORE_DIR, 'index.json')) as f:
+                    index = json.load(f)
+                price_store.update(
+                    stamp=stamp,
+                    symbols=index['symbols'],
+                    days=np.load(os.path.join(PRICE_STORE_DIR, index['days']), mmap_mode='r'),
+                    closes=np.load(os.path.join(PRICE_STORE_DIR, index['closes']), mmap_mode='r')
+                )
+            except Exception as e:
+                print(f"Price store read error: {e}")
+                return None
+        return dict(price_store)
+
+def read_price_store(symbols):
+    """Cache entries for whichever symbols are in the imported price store.
+
+    The entries are ordinary dicts copied out of the mapped arrays, so the
+    store saves download and parse time, not per-worker memory.
+    """
+    store = open_price_store()
+    if store is None:
+        return {}
+
+    entries = {}
+    for symbol in symbols:
+        item = store['symbols'].get(symbol)
+        if item is None:
+            continue
+        rows = slice(item['offset'], item['offset'] + item['count'])
+        dates = store['days'][rows].astype('datetime64[D]').astype(str)
+        entries[symbol] = {
+            'start': item['start'],
+            'end': item['end'],
+            'prices': dict(zip(dates.tolist(), store['closes'][rows].tolist())),
+            'used': time.time()
+        }
+    return entries
+
+def write_price_store(series):
+    """Replace the price store with {symbol: {date: close}}.
+
+    Days (int32 days since 1970) and closes (float64) are two flat .npy
+    arrays with each symbol's rows contiguous, and index.json maps symbols
+    to their slice. The arrays are written under new names and index.json
+    is swapped in last, so readers never see a mix of old and new.
+    """
+    os.makedirs(PRICE_STORE_DIR, exist_ok=True)
+    index = {}
+    days, closes = [], []
+    offset = 0
+    for symbol in sorted(series):
+        dates = sorted(series[symbol])
+        if not dates:
+            continue
+        symbol_days = np.array(dates, dtype='datetime64[D]')
+        days.append(symbol_days.astype(np.int32))
+        closes.append(np.array([series[symbol][day] for day in dates], dtype=np.float64))
+        index[symbol] = {'offset': offset, 'count': len(dates), 'start': dates[0], 'end': str(symbol_days[-1] + 1)}
+        offset += len(dates)
+
+    generation = datetime.now().strftime('%Y%m%d%H%M%S%f')
+    files = {'days': f"days-{generation}.npy", 'closes': f"closes-{generation}.npy"}
+    np.save(os.path.join(PRICE_STORE_DIR, files['days']), np.concatenate(days) if days else np.zeros(0, np.int32))
+    np.save(os.path.join(PRICE_STORE_DIR, files['closes']), np.concatenate(closes) if closes else np.zeros(0))
+
+    fd, tmp_path = tempfile.mkstemp(dir=PRICE_STORE_DIR, prefix='.index.', suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump({**files, 'symbols': index}, f, separators=(',', ':'))
+    os.chmod(tmp_path, 0o644)
+    os.replace(tmp_path, os.path.join(PRICE_STORE_DIR, 'index.json'))
+
+    # Workers still mapping the old arrays keep them until they reopen
+    for name in os.listdir(PRICE_STORE_DIR):
+        if name.endswith('.npy') and name not in files.values():
+            os.unlink(os.path.join(PRICE_STORE_DIR, name))
+
+@contextmanager
+def price_cache_file_lock():
+    """Hold an exclusive lock on the price cache files across processes."""
+    if fcntl is None:
+        yield
+        return
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with open(os.path.join(CACHE_DIR, '.lock'), 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def merge_price_entry(entry, other):
+    """Fold another copy of a symbol's cache entry into entry.
+
+    A copy re-downloaded after a restatement (a newer basis) replaces an
+    older one outright, so pre-split closes never sit next to adjusted ones.
+    """
+    if other.get('basis', 0) != entry.get('basis', 0):
+        if other.get('basis', 0) > entry.get('basis', 0):
+            entry.update(start=other['start'], end=other['end'], prices=dict(other['prices']), basis=other['basis'])
+        entry['used'] = max(entry['used'], other['used'])
+        return
+
+    # Only widen the covered range when the two ranges touch
+    if other['start'] <= entry['end'] and entry['start'] <= other['end']:
+        entry['start'] = min(entry['start'], other['start'])
+        entry['end'] = max(entry['end'], other['end'])
+    for day, price in other['prices'].items():
+        entry['prices'].setdefault(day, price)
+    entry['used'] = max(entry['used'], other['used'])
+
+def evict_price_cache(keep=()):
+    """Drop stale symbols, then least recently used ones over the size limit.
+
+    Symbols in keep, or pinned by a load_prices call in progress, are never
+    dropped, so the limit gives way to what the current calls need.
+    """
+    cutoff = time.time() - PRICE_CACHE_MAX_AGE_DAYS * 86400
+    keep = set(keep)
+    evictable = [symbol for symbol in price_cache if symbol not in price_cache_pins and symbol not in keep]
+    expired = [symbol for symbol in evictable if price_cache[symbol]['used'] < cutoff]
+    excess = len(price_cache) - len(expired) - PRICE_CACHE_MAX_SYMBOLS
+    lru = [symbol for symbol in evictable if price_cache[symbol]['used'] >= cutoff][:max(excess, 0)]
+    for symbol in expired + lru:
+        del price_cache[symbol]
+
+def load_price_cache():
+    """Load the on-disk price cache into memory, once per process.
+
+    With MongoDB the store is read per symbol on demand instead.
+    """
+    global price_cache_loaded
+    with price_cache_lock:
+        if price_cache_loaded:
+            return
+        if mongo() is None:
+            prune_price_cache_files()
+        entries = read_price_cache_files() if mongo() is None else {}
+        for symbol in sorted(entries, key=lambda s: entries[s]['used']):
+            price_cache[symbol] = entries[symbol]
+        evict_price_cache()
+        price_cache_loaded = True
+
+def ensure_price_indexes():
+    global price_indexes_ready
+    if not price_indexes_ready:
+        mongo().prices.create_index([('symbol', 1), ('date', 1)], unique=True)
+        price_indexes_ready = True
+
+def read_mongo_prices(symbols, start_date, end_date):
+    """Read the stored coverage and daily closes in [start_date, end_date) from MongoDB.
+
+    Prices are one document per symbol per day; price_coverage records the
+    [start, end) range already fetched for each symbol. Entries only claim
+    the part of that coverage inside the requested range, since that's all
+    the closes read here.
+    """
+    db = mongo()
+    ensure_price_indexes()
+    with timed('price_store_read'):
+        entries = {}
+        for doc in db.price_coverage.find({'_id': {'$in': list(symbols)}}):
+            start, end = max(doc['start'], start_date), min(doc['end'], end_date)
+            if start < end:
+                entries[doc['_id']] = {'start': start, 'end': end, 'prices': {}, 'used': time.time(), 'basis': doc.get('basis', 0)}
+        if entries:
+            cursor = db.prices.find(
+                {'symbol': {'$in': list(entries)}, 'date': {'$gte': start_date, '$lt': end_date}},
+                {'_id': 0, 'symbol': 1, 'date': 1, 'close': 1}
+            )
+            for doc in cursor:
+                entries[doc['symbol']]['prices'][doc['date']] = doc['close']
+    return entries
+
+def write_mongo_prices(symbols, fetch_start, fetch_end, fetched, basis=None):
+    """Upsert freshly fetched closes and widen each symbol's coverage.
+
+    With a basis the closes are a full re-download that supersedes the old ones.
+    """
+    from pymongo import UpdateOne
+
+    db = mongo()
+    ensure_price_indexes()
+    now = time.time()
+    price_ops = [
+        UpdateOne(
+            {'symbol': symbol, 'date': day},
+            {'$set': {'symbol': symbol, 'date': day, 'close': price}},
+            upsert=True
+        )
+        for symbol in symbols
+        for day, price in fetched[symbol].items()
+    ]
+    coverage_update = {'$min': {'start': fetch_start}, '$max': {'end': fetch_end}, '$set': {'used': now}}
+    if basis:
+        coverage_update['$max']['basis'] = basis
+    coverage_ops = [UpdateOne({'_id': symbol}, coverage_update, upsert=True) for symbol in symbols]
+    with timed('price_store_write'):
+        # Prices first, so a reader never sees coverage without the closes
+        if price_ops:
+            db.prices.bulk_write(price_ops, ordered=False)
+        db.price_coverage.bulk_write(coverage_ops, ordered=False)
+
+def read_stored_prices(symbols, start_date, end_date):
+    if mongo() is not None:
+        try:
+            return read_mongo_prices(symbols, start_date, end_date)
+        except Exception as e:
+            print(f"MongoDB price read error: {e}")
+    return read_price_cache_files(symbols)
+
+def merge_price_entries(stored):
+    """Fold entries other workers have stored into memory."""
+    with price_cache_lock:
+        for symbol, other in stored.items():
+            if symbol in price_cache:
+                merge_price_entry(price_cache[symbol], other)
+            else:
+                price_cache[symbol] = other
+                price_cache.move_to_end(symbol, last=False)
+        evict_price_cache()
+
+def merge_stored_prices(symbols, start_date, end_date):
+    """Fold in what other workers have stored for symbols over [start_date, end_date)."""
+    merge_price_entries(read_stored_prices(symbols, start_date, end_date))
+
+def save_price_cache(symbols):
+    """Merge symbols with whatever other workers have written, then persist just those."""
+    with price_cache_file_lock():
+        merge_price_entries(read_price_cache_files(symbols))
+        with price_cache_lock:
+            entries = {
+                symbol: dict(price_cache[symbol], prices=dict(price_cache[symbol]['prices']))
+                for symbol in symbols if symbol in price_cache
+            }
+        try:
+            with timed('price_cache_write'):
+                write_price_cache_files(entries)
+        except Exception as e:
+            print(f"Price cache write error: {e}")
 
-    try:
-        # Download data for all symbols
+def store_prices(symbols, fetch_start, fetch_end, fetched, basis=None):
+    """Persist a completed fetch to MongoDB, or rewrite its symbols' cache files."""
+    if mongo() is not None:
+        try:
+            write_mongo_prices(symbols, fetch_start, fetch_end, fetched, basis)
+            return
+        except Exception as e:
+            print(f"MongoDB price write error: {e}")
+    save_price_cache(symbols)
+
+def price_stripe(symbol):
+    """The download stripe a symbol is batched in, the same in every worker."""
+    return sum(map(ord, symbol)) % PRICE_BATCH_CONCURRENCY
+
+@contextmanager
+def price_fetch_lock(fetch_start, fetch_end, stripe):
+    """Serialize downloads of one date range and symbol stripe across threads and workers."""
+    stripe = sum(map(ord, f"{fetch_start}_{fetch_end}_{stripe}")) % PRICE_FETCH_LOCK_STRIPES
+    with price_fetch_locks[stripe]:
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(os.path.join(CACHE_DIR, f".fetch{stripe}.lock"), 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def download_yfinance_prices(symbols, start_date, end_date):
+    """Download adjusted closes as {symbol: {date: price}} for [start_date, end_date)."""
+    import yfinance as yf
+
+    with upstream_call('yfinance_download'):
         data = yf.download(symbols, start=start_date, end=end_date, auto_adjust=True, progress=False)
 
-        if data.empty:
-            return None
+    prices = {symbol: {} for symbol in symbols}
+    if data.empty:
+        return prices
 
-        # Handle single vs multiple symbols
-        if len(symbols) == 1:
-            prices = {symbols[0]: {}}
-            for date, row in data.iterrows():
-                date_str = date.strftime('%Y-%m-%d')
-                prices[symbols[0]][date_str] = float(row['Close'])
-        else:
-            prices = {symbol: {} for symbol in symbols}
-            for date, row in data.iterrows():
-                date_str = date.strftime('%Y-%m-%d')
-                for symbol in symbols:
-                    if symbol in row['Close'].index:
-                        price = row['Close'][symbol]
-                        if not (price != price):  # Check for NaN
-                            prices[symbol][date_str] = float(price)
+    closes = data['Close']
+    if not hasattr(closes, 'columns'):  # Single symbol on older yfinance
+        closes = closes.to_frame(symbols[0])
+
+    # yfinance can hand back rows just outside the requested window
+    dates = closes.index.strftime('%Y-%m-%d')
+    in_range = (dates >= start_date) & (dates < end_date)
+    dates = dates[in_range]
+    matrix = closes.reindex(columns=symbols).to_numpy(dtype=float)[in_range]
+
+    for j, symbol in enumerate(symbols):
+        column = matrix[:, j]
+        valid = ~np.isnan(column)
+        prices[symbol] = dict(zip(dates[valid].tolist(), column[valid].tolist()))
+
+    return prices
+
+def no_prices(symbols, start_date, end_date):
+    """Offline provider: only the price store and cache are used."""
+    return {symbol: {} for symbol in symbols}
+
+PRICE_PROVIDERS = {
+    'yfinance': download_yfinance_prices,
+    'none': no_prices
+}
+
+def download_prices(symbols, start_date, end_date):
+    """Fetch closes for [start_date, end_date) from the configured provider."""
+    provider = PRICE_PROVIDERS.get(PRICE_PROVIDER)
+    if provider is None:
+        module_name, _, name = PRICE_PROVIDER.partition(':')
+        provider = PRICE_PROVIDERS[PRICE_PROVIDER] = getattr(importlib.import_module(module_name), name)
+    return provider(symbols, start_date, end_date)
+
+def missing_price_ranges(entry, start_date, end_date):
+    """Return the [start, end) ranges not yet covered by a symbol's cache entry."""
+    if entry is None:
+        return [(start_date, end_date)]
+
+    ranges = []
+    if start_date < entry['start']:
+        ranges.append((start_date, entry['start']))
+    if entry['end'] < end_date:
+        ranges.append((entry['end'], end_date))
+    return ranges
+
+def market_holidays(year):
+    """NYSE full-day closures in year as a set of 'YYYY-MM-DD'.
+
+    Covers the regular holiday schedule (a Saturday holiday is observed on
+    the Friday, a Sunday one on the Monday, except New Year's Day, which is
+    skipped when it falls on a Saturday). One-off closures aren't included.
+    """
+    if year in market_holiday_cache:
+        return market_holiday_cache[year]
+
+    def nth_weekday(month, weekday, n):
+        first = datetime(year, month, 1)
+        return first + timedelta(days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+
+    def last_weekday(month, weekday):
+        last = datetime(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)
+        return last - timedelta(days=(last.weekday() - weekday) % 7)
+
+    def observed(date):
+        if date.weekday() == 5:
+            return date - timedelta(days=1)
+        if date.weekday() == 6:
+            return date + timedelta(days=1)
+        return date
+
+    # Easter Sunday (Meeus/Jones/Butcher), for Good Friday
+    cycle, century, rest = year % 19, year // 100, year % 100
+    skip = (century - (century + 8) // 25 + 1) // 3
+    epact = (19 * cycle + century - century // 4 - skip + 15) % 30
+    weekday = (32 + 2 * (century % 4) + 2 * (rest // 4) - epact - rest % 4) % 7
+    shift = (cycle + 11 * epact + 22 * weekday) // 451
+    offset = epact + weekday - 7 * shift + 114
+    easter = datetime(year, offset // 31, offset % 31 + 1)
+
+    holidays = [
+        nth_weekday(1, 0, 3),               # Martin Luther King Jr. Day
+        nth_weekday(2, 0, 3),               # Washington's Birthday
+        easter - timedelta(days=2),         # Good Friday
+        last_weekday(5, 0),                 # Memorial Day
+        observed(datetime(year, 7, 4)),     # Independence Day
+        nth_weekday(9, 0, 1),               # Labor Day
+        nth_weekday(11, 3, 4),              # Thanksgiving
+        observed(datetime(year, 12, 25))    # Christmas
+    ]
+    if datetime(year, 1, 1).weekday() != 5:
+        holidays.append(observed(datetime(year, 1, 1)))
+    if year >= 2022:
+        holidays.append(observed(datetime(year, 6, 19)))  # Juneteenth
+
+    market_holiday_cache[year] = {date.strftime('%Y-%m-%d') for date in holidays}
+    return market_holiday_cache[year]
+
+def is_trading_day(date):
+    """Check whether a datetime falls on a weekday the market is open."""
+    return date.weekday() < 5 and date.strftime('%Y-%m-%d') not in market_holidays(date.year)
+
+def previous_trading_day(day):
+    """The last trading day before day (both 'YYYY-MM-DD')."""
+    date = datetime.strptime(day, '%Y-%m-%d') - timedelta(days=1)
+    while not is_trading_day(date):
+        date -= timedelta(days=1)
+    return date.strftime('%Y-%m-%d')
+
+def has_trading_days(start_date, end_date):
+    """Check whether [start_date, end_date) contains any trading day."""
+    day = datetime.strptime(start_date, '%Y-%m-%d')
+    end = datetime.strptime(end_date, '%Y-%m-%d')
+    while day < end:
+        if is_trading_day(day):
+            return True
+        day += timedelta(days=1)
+    return False
+
+def cached_closes_between(start_date, end_date):
+    """Check whether any cached symbol has a close in [start_date, end_date)."""
+    day = datetime.strptime(start_date, '%Y-%m-%d')
+    end = datetime.strptime(end_date, '%Y-%m-%d')
+    days = []
+    while day < end:
+        if is_trading_day(day):
+            days.append(day.strftime('%Y-%m-%d'))
+        day += timedelta(days=1)
+    with price_cache_lock:
+        return any(day in entry['prices'] for entry in price_cache.values() for day in days)
+
+def fetch_price_range(symbols, fetch_start, fetch_end):
+    """Download [fetch_start, fetch_end) for one batch of symbols into the price cache.
+
+    All symbols in a batch share a stripe, and only one thread or worker
+    downloads a given range and stripe at a time. Whoever waited re-checks
+    the cache afterwards and skips symbols that the first fetch already
+    covered.
+    """
+    with price_fetch_lock(fetch_start, fetch_end, price_stripe(symbols[0])):
+        # Only the days still missing matter; the rest is already in memory
+        merge_stored_prices(symbols, fetch_start, fetch_end)
+        with price_cache_lock:
+            symbols = [
+                symbol for symbol in symbols
+                if missing_price_ranges(price_cache.get(symbol), fetch_start, fetch_end)
+            ]
+            # History before a listing is legitimately empty
+            heads = {symbol for symbol in symbols if symbol in price_cache and price_cache[symbol]['start'] == fetch_end}
+            # Tail fetches re-download the last covered day to spot restatements
+            overlap = previous_trading_day(fetch_start)
+            tails = {
+                symbol: price_cache[symbol]['prices'].get(overlap) for symbol in symbols
+                if symbol in price_cache and price_cache[symbol]['end'] == fetch_start
+                and price_cache[symbol]['start'] <= overlap
+            }
+        if not symbols:
+            return
 
-        # Cache the result
-        cache[cache_key] = prices
-        save_cache(cache)
+        fetched = download_price_range(symbols, overlap if tails else fetch_start, fetch_end)
+        for symbol in symbols:
+            if symbol not in tails:
+                fetched[symbol] = {day: price for day, price in fetched[symbol].items() if day >= fetch_start}
+
+        # Holidays and weekends legitimately come back empty and are marked
+        # covered; an empty answer for a range with a trading day is an
+        # upstream hiccup, so the batch fails and the result is stale. A lone
+        # symbol coming back empty when other symbols have closes for those
+        # days says more about the ticker, so that's left to the per-symbol
+        # check below.
+        trading = has_trading_days(fetch_start, fetch_end)
+        if (trading and not any(day >= fetch_start for closes in fetched.values() for day in closes)
+                and (len(symbols) > 1 or not cached_closes_between(fetch_start, fetch_end))):
+            record_circuit('prices', False)
+            raise ValueError(f"No closes returned for {fetch_start}..{fetch_end}")
+        record_circuit('prices', True)
+
+        # Empty symbols stay uncovered until their backoff runs out of tries
+        empty = []
+        if trading:
+            now = time.time()
+            with price_cache_lock:
+                for symbol in symbols:
+                    if symbol in heads or any(day >= fetch_start for day in fetched[symbol]):
+                        price_empty_symbols.pop(symbol, None)
+                        continue
+                    record = price_empty_symbols.setdefault(symbol, {'attempts': 0, 'retry_at': 0})
+                    record['attempts'] += 1
+                    if record['attempts'] < PRICE_EMPTY_ATTEMPTS:
+                        record['retry_at'] = now + PRICE_EMPTY_RETRY_SECONDS * 2 ** (record['attempts'] - 1)
+                        empty.append(symbol)
+                    else:
+                        del price_empty_symbols[symbol]
+                        print(f"No closes for {symbol} after {PRICE_EMPTY_ATTEMPTS} tries, taking {fetch_start}..{fetch_end} as empty")
+            if empty:
+                print(f"No closes for {', '.join(empty)} in {fetch_start}..{fetch_end}, retrying later")
+        symbols = [symbol for symbol in symbols if symbol not in empty]
+
+        restated = [
+            symbol for symbol in symbols
+            if tails.get(symbol) is not None and overlap in fetched[symbol]
+            and abs(fetched[symbol][overlap] - tails[symbol]) > PRICE_RESTATE_TOLERANCE * abs(tails[symbol])
+        ]
+        if restated:
+            with price_cache_lock:
+                restate_start = min(price_cache[symbol]['start'] for symbol in restated)
+            print(f"Adjusted closes restated for {', '.join(restated)}, downloading from {restate_start}")
+            full = download_price_range(restated, restate_start, fetch_end)
+            if not all(full[symbol] for symbol in restated):
+                raise ValueError(f"Restated history missing for {', '.join(s for s in restated if not full[s])}")
+            symbols = [symbol for symbol in symbols if symbol not in restated]
+
+        with price_cache_lock:
+            if restated:
+                basis = time.time()
+                for symbol in restated:
+                    price_cache[symbol] = {'start': restate_start, 'end': fetch_end, 'prices': full[symbol], 'used': basis, 'basis': basis}
+            for symbol in symbols:
+                new_entry = {'start': fetch_start, 'end': fetch_end, 'prices': fetched[symbol], 'used': time.time()}
+                if symbol in price_cache:
+                    new_entry['basis'] = price_cache[symbol].get('basis', 0)
+                    merge_price_entry(price_cache[symbol], new_entry)
+                    price_cache[symbol]['prices'].update(fetched[symbol])
+                else:
+                    price_cache[symbol] = new_entry
+        if restated:
+            store_prices(restated, restate_start, fetch_end, full, basis)
+        if symbols:
+            store_prices(symbols, fetch_start, fetch_end, fetched)
+
+def download_price_range(symbols, start_date, end_date):
+    """download_prices behind the price provider's circuit breaker."""
+    if not circuit_allows('prices'):
+        raise UpstreamUnavailable('price provider circuit is open')
+    try:
+        return download_prices(symbols, start_date, end_date)
+    except Exception:
+        record_circuit('prices', False)
+        raise
+
+async def fetch_price_batch(limit, symbols, fetch_start, fetch_end):
+    """Download one batch once a slot and the request pacing allow; returns the symbols that failed."""
+    async with limit:
+        if PRICE_REQUESTS_PER_SECOND > 0:
+            now = time.monotonic()
+            start_at = max(now, price_pacing['next'])
+            price_pacing['next'] = start_at + 1 / PRICE_REQUESTS_PER_SECOND
+            await asyncio.sleep(start_at - now)
+        try:
+            await in_thread(fetch_price_range, symbols, fetch_start, fetch_end)
+            return []
+        except Exception as e:
+            print(f"Price batch {symbols[0]}..{symbols[-1]} ({len(symbols)}) failed: {e}")
+            return symbols
+
+async def fetch_price_ranges(fetches):
+    """Download every missing (start, end) range in batches, returning the symbols that failed.
+
+    Each batch lands in the price cache as soon as it completes, so a failed
+    batch only costs its own symbols, and only those are retried.
+    """
+    limit = asyncio.Semaphore(PRICE_BATCH_CONCURRENCY)
+    budget = PRICE_REQUEST_BUDGET
+    pending = fetches
+    for attempt in range(PRICE_RETRIES + 1):
+        if attempt:
+            # No point retrying into an open circuit; revalidation picks it up later
+            if circuit_retry_in('prices'):
+                break
+            await asyncio.sleep(PRICE_RETRY_BACKOFF_SECONDS * 2 ** (attempt - 1))
+
+        size = max(PRICE_BATCH_SIZE >> attempt, 1)
+        batches = []
+        for (fetch_start, fetch_end), fetch_symbols in pending.items():
+            stripes = {}
+            for symbol in fetch_symbols:
+                stripes.setdefault(price_stripe(symbol), []).append(symbol)
+            batches.extend(
+                (stripe_symbols[i:i + size], fetch_start, fetch_end)
+                for _, stripe_symbols in sorted(stripes.items())
+                for i in range(0, len(stripe_symbols), size)
+            )
+        skipped, batches = batches[budget:], batches[:budget]
+        budget -= len(batches)
+        failed = await asyncio.gather(*(fetch_price_batch(limit, *batch) for batch in batches))
+
+        pending = {}
+        for (_, fetch_start, fetch_end), batch_failed in zip(batches, failed):
+            if batch_failed:
+                pending.setdefault((fetch_start, fetch_end), []).extend(batch_failed)
+        if skipped:
+            print(f"Price request budget spent, {sum(len(batch[0]) for batch in skipped)} symbol(s) left for later")
+            for batch_symbols, fetch_start, fetch_end in skipped:
+                pending.setdefault((fetch_start, fetch_end), []).extend(batch_symbols)
+            break
+        if not pending:
+            break
+
+    return sorted({symbol for fetch_symbols in pending.values() for symbol in fetch_symbols})
+
+def load_prices(symbols, start_date, end_date=None):
+    """Fetch adjusted close prices for symbols, returning (prices, stale).
+
+    Prices are cached per symbol along with the date range already fetched,
+    so only the uncovered head or tail of the range is downloaded. If that
+    download fails (or the provider's circuit is open) the cached prices are
+    returned as they are, with stale set.
+    """
+    if end_date is None:
+        end_date = datetime.now().strftime('%Y-%m-%d')
 
-        return prices
+    load_price_cache()
+    with price_cache_lock:
+        for symbol in symbols:
+            price_cache_pins[symbol] = price_cache_pins.get(symbol, 0) + 1
+    try:
+        return assemble_prices(symbols, start_date, end_date)
+    finally:
+        with price_cache_lock:
+            for symbol in symbols:
+                price_cache_pins[symbol] -= 1
+                if not price_cache_pins[symbol]:
+                    del price_cache_pins[symbol]
+            # The symbols just read stay even past the limit, or a league
+            # bigger than the cache would be downloaded again on every request
+            evict_price_cache(keep=symbols)
+
+def assemble_prices(symbols, start_date, end_date):
+    """The body of load_prices, run while its symbols are pinned in the cache."""
+    # Symbols this worker hasn't seen may already be in the shared store or
+    # the imported price store
+    with price_cache_lock:
+        unseen = [symbol for symbol in symbols if symbol not in price_cache]
+    if unseen:
+        merge_stored_prices(unseen, start_date, end_date)
+        merge_price_entries(read_price_store(unseen))
+
+    # Group symbols that are missing the same range into one download
+    # (skipping symbols that came back empty until their retry is due)
+    fetches = {}
+    now = time.time()
+    with price_cache_lock:
+        for symbol in symbols:
+            missing_ranges = missing_price_ranges(price_cache.get(symbol), start_date, end_date)
+            count_cache('price', not missing_ranges)
+            if price_empty_symbols.get(symbol, {}).get('retry_at', 0) > now:
+                continue
+            for missing in missing_ranges:
+                fetches.setdefault(missing, []).append(symbol)
+
+    stale = False
+    if PRICE_PROVIDER == 'none':
+        # Offline: there's nothing to download, so a range with trading days
+        # the stores don't cover is simply stale
+        stale = any(has_trading_days(*missing) for missing in fetches)
+        fetches = {}
+    try:
+        if fetches:
+            failed = run_upstream(fetch_price_ranges({key: sorted(fetch_symbols) for key, fetch_symbols in fetches.items()}))
+            if failed:
+                print(f"Error fetching stock data for {len(failed)} symbol(s): {', '.join(failed[:10])}")
+                stale = True
     except Exception as e:
         print(f"Error fetching stock data: {e}")
+        stale = True
+
+    now = time.time()
+    prices = {}
+    with price_cache_lock:
+        for symbol in symbols:
+            entry = price_cache.get(symbol)
+            if entry is None:
+                prices[symbol] = {}
+                continue
+            entry['used'] = now
+            price_cache.move_to_end(symbol)
+            prices[symbol] = {
+                day: price for day, price in entry['prices'].items()
+                if start_date <= day < end_date
+            }
+
+    if not any(prices.values()):
+        return None, stale
+
+    return prices, stale
+
+def get_stock_data(symbols, start_date, end_date=None):
+    """Fetch adjusted close prices for symbols from start_date to end_date."""
+    return load_prices(symbols, start_date, end_date)[0]
+
+def download_intraday_prices(symbols):
+    """Download the latest session's bars as {'times', 'symbols', 'matrix'}.
+
+    Times are 'YYYY-MM-DD HH:MM' in market time; the matrix is
+    bars x symbols with NaN where a symbol has no bar.
+    """
+    import yfinance as yf
+
+    with upstream_call('yfinance_intraday'):
+        data = yf.download(symbols, period='1d', interval=INTRADAY_INTERVAL, auto_adjust=True, progress=False)
+    if data.empty:
         return None
 
-def validate_symbol(symbol):
-    """Check if a stock symbol is valid."""
+    closes = data['Close']
+    if not hasattr(closes, 'columns'):  # Single symbol on older yfinance
+        closes = closes.to_frame(symbols[0])
+
+    index = closes.index
+    if index.tz is not None:
+        index = index.tz_convert(MARKET_TIMEZONE)
+    return {
+        'times': [t.strftime('%Y-%m-%d %H:%M') for t in index],
+        'symbols': symbols,
+        'matrix': closes.reindex(columns=symbols).to_numpy(dtype=float)
+    }
+
+def get_intraday_prices(symbols):
+    """Latest session bars for symbols, cached for INTRADAY_TTL_SECONDS.
+
+    Each symbol set's lock is held while downloading, so concurrent callers
+    for one league share a fetch without queueing behind other leagues.
+    """
+    key = tuple(sorted(symbols))
+    with intraday_lock:
+        key_lock = intraday_locks.setdefault(key, threading.Lock())
+    with key_lock:
+        now = time.time()
+        with intraday_lock:
+            cached = intraday_cache.get(key)
+        count_cache('intraday', bool(cached and cached[0] > now))
+        if cached and cached[0] > now:
+            return cached[1]
+        bars = None
+        if circuit_allows('intraday'):
+            try:
+                bars = run_upstream(in_thread(download_intraday_prices, list(key)))
+                record_circuit('intraday', True)
+            except Exception as e:
+                print(f"Error fetching intraday data: {e}")
+                record_circuit('intraday', False)
+        # Failures are cached too, so a broken upstream isn't hit per request
+        with intraday_lock:
+            for stale in [k for k, (expires, _) in intraday_cache.items() if expires <= now]:
+                del intraday_cache[stale]
+                if stale != key:
+                    intraday_locks.pop(stale, None)
+            intraday_cache[key] = (time.time() + INTRADAY_TTL_SECONDS, bars)
+        return bars
+
+def build_price_matrix(prices, trading_days, symbols):
+    """Build a trading_days x symbols matrix of closes.
+
+    Missing data rules: a day with no close carries the symbol's previous
+    close forward. Days before a symbol's first close stay NaN.
+    """
+    day_index = {day: i for i, day in enumerate(trading_days)}
+    matrix = np.full((len(trading_days), len(symbols)), np.nan)
+    for j, symbol in enumerate(symbols):
+        for day, price in prices.get(symbol, {}).items():
+            i = day_index.get(day)
+            if i is not None:
+                matrix[i, j] = price
+
+    return forward_fill(matrix)
+
+def forward_fill(matrix):
+    """Replace NaNs in each column with the last non-NaN value above them."""
+    # Point every cell at the last row that had a value
+    rows = np.where(np.isnan(matrix), 0, np.arange(matrix.shape[0])[:, None])
+    np.maximum.accumulate(rows, axis=0, out=rows)
+    return matrix[rows, np.arange(matrix.shape[1])]
+
+def value_portfolios(matrix, start_prices, shares, short_cols, allocation):
+    """Value every portfolio on every row of a price matrix.
+
+    Returns (long_values, short_pnl), each players x rows.
+    """
+    long_values = (np.nan_to_num(matrix) @ shares.T).T
+
+    short_start = start_prices[short_cols]
+    short_prices = matrix[:, short_cols]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        short_pnl = -(short_prices - short_start) / short_start * allocation
+    short_pnl = np.where((short_start > 0) & ~np.isnan(short_prices), short_pnl, 0.0).T
+
+    return long_values, short_pnl
+
+def compute_portfolio_values(prices, trading_days, players, allocation):
+    """Compute every player's daily long value and short P&L.
+
+    Each long buys `allocation` worth of shares at the first trading day's
+    close; a symbol with no close on that day holds no shares. The short is
+    P&L only (no principal): if the stock drops 50% it gains half the
+    allocation, if it doubles it loses the whole allocation. Days where a
+    position has no price yet count as zero.
+
+    Returns a dict with 'long' and 'short_pnl' arrays of shape
+    players x trading_days, plus the 'symbols', price 'matrix', players x
+    symbols 'shares' and each player's 'short_cols' used.
+    """
+    symbols = sorted({s for player in players for s in player['longs'] + [player['short']]})
+    sym_index = {symbol: j for j, symbol in enumerate(symbols)}
+    matrix = build_price_matrix(prices, trading_days, symbols)
+    start_prices = matrix[0] if len(trading_days) else np.full(len(symbols), np.nan)
+
+    # Shares held per player per symbol (a symbol listed twice counts twice)
+    shares = np.zeros((len(players), len(symbols)))
+    for i, player in enumerate(players):
+        for symbol in player['longs']:
+            j = sym_index[symbol]
+            if start_prices[j] > 0:
+                shares[i, j] += allocation / start_prices[j]
+
+    short_cols = [sym_index[player['short']] for player in players]
+    long_values, short_pnl = value_portfolios(matrix, start_prices, shares, short_cols, allocation)
+
+    return {
+        'symbols': symbols,
+        'matrix': matrix,
+        'shares': shares,
+        'short_cols': short_cols,
+        'long': long_values,
+        'short_pnl': short_pnl
+    }
+
+def backtest_chunk(matrix, long_cols, short_cols, starts, end, allocation):
+    """Evaluate portfolio variants against a days x symbols price matrix.
+
+    Variant v buys `allocation` of each symbol in long_cols[v] and shorts
+    short_cols[v] at the close of day starts[v], following the same rules
+    as compute_portfolio_values(). Returns (long_value, short_pnl,
+    max_drawdown) arrays, values taken at day `end`.
+    """
+    window = matrix[:end + 1]
+    variants = np.arange(len(starts))
+
+    start_prices = window[starts[:, None], long_cols]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        per_symbol = np.where(start_prices > 0, allocation / start_prices, 0.0)
+    shares = np.zeros((len(starts), matrix.shape[1]))
+    np.add.at(shares, (np.repeat(variants, long_cols.shape[1]), long_cols.ravel()), per_symbol.ravel())
+    long_values = shares @ np.nan_to_num(window).T
+
+    short_start = window[starts, short_cols]
+    short_prices = window[:, short_cols].T
+    with np.errstate(divide='ignore', invalid='ignore'):
+        short_pnl = -(short_prices - short_start[:, None]) / short_start[:, None] * allocation
+    short_pnl = np.where((short_start[:, None] > 0) & ~np.isnan(short_prices), short_pnl, 0.0)
+
+    # Drawdown only counts from each variant's own start day
+    total = np.where(np.arange(window.shape[0]) >= starts[:, None], long_values + short_pnl, np.nan)
+    peak = np.fmax.accumulate(total, axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        drawdown = np.where(peak > 0, total / peak - 1, 0.0)
+    max_drawdown = np.nanmin(drawdown, axis=1)
+
+    return long_values[:, -1], short_pnl[:, -1], max_drawdown
+
+def backtest_pool():
+    """Process pool for large backtests, created on first use in each process.
+
+    Workers are spawned rather than forked, since forking a threaded
+    gunicorn worker isn't safe.
+    """
+    if backtest_state['pid'] != os.getpid():
+        with backtest_lock:
+            if backtest_state['pid'] != os.getpid():
+                backtest_state.update(pid=os.getpid(), pool=ProcessPoolExecutor(
+                    max_workers=BACKTEST_PROCESSES, mp_context=multiprocessing.get_context('spawn')
+                ))
+    return backtest_state['pool']
+
+def run_backtest(matrix, long_cols, short_cols, starts, end, allocation):
+    """Evaluate every variant in chunks, in parallel for large batches."""
+    chunk_size = BACKTEST_CHUNK_VARIANTS
+    if len(starts) >= BACKTEST_PARALLEL_MIN_VARIANTS and BACKTEST_PROCESSES > 1:
+        chunk_size = max(-(-len(starts) // BACKTEST_PROCESSES), 1)
+    chunks = [slice(i, i + chunk_size) for i in range(0, len(starts), chunk_size)]
+
+    if len(chunks) > 1 and len(starts) >= BACKTEST_PARALLEL_MIN_VARIANTS and BACKTEST_PROCESSES > 1:
+        futures = [
+            backtest_pool().submit(backtest_chunk, matrix, long_cols[c], short_cols[c], starts[c], end, allocation)
+            for c in chunks
+        ]
+        results = [future.result() for future in futures]
+    else:
+        results = [backtest_chunk(matrix, long_cols[c], short_cols[c], starts[c], end, allocation) for c in chunks]
+
+    return tuple(np.concatenate(parts) for parts in zip(*results))
+
+def get_intraday_values(analytics):
+    """Value every portfolio at each bar of a session newer than the last daily close.
+
+    Returns {'times', 'long', 'short_pnl'} (players x bars) or None when
+    there is no such session yet. Outside regular market hours nothing is
+    downloaded; the session's closes arrive as a daily close instead.
+    """
+    if not is_market_open():
+        return None
+    bars = get_intraday_prices(analytics['symbols'])
+    if not bars or bars['times'][-1][:10] <= analytics['trading_days'][-1]:
+        return None
+
+    # Seed with the last daily close so symbols without a bar yet carry it
+    matrix = np.full((len(bars['times']) + 1, len(analytics['symbols'])), np.nan)
+    matrix[0] = analytics['matrix'][-1]
+    for j_bar, symbol in enumerate(bars['symbols']):
+        matrix[1:, analytics['sym_index'][symbol]] = bars['matrix'][:, j_bar]
+    matrix = forward_fill(matrix)[1:]
+
+    long_values, short_pnl = value_portfolios(
+        matrix, analytics['start_prices'], analytics['shares'],
+        analytics['short_cols'], analytics['competition']['stock_allocation']
+    )
+    return {'times': bars['times'], 'long': long_values, 'short_pnl': short_pnl}
+
+def lookup_symbol(symbol):
+    import yfinance as yf
+
+    with upstream_call('yfinance_info'):
+        info = yf.Ticker(symbol).info
+    return info.get('regularMarketPrice') is not None or info.get('previousClose') is not None
+
+async def validate_symbol_async(symbol):
+    """Check if a stock symbol is valid, caching the answer."""
+    now = time.time()
+    with symbol_validation_lock:
+        cached = symbol_validation_cache.get(symbol)
+        if cached:
+            symbol_validation_cache.move_to_end(symbol)
+    count_cache('symbol_validation', bool(cached and cached[0] > now))
+    if cached and cached[0] > now:
+        return cached[1]
+
     try:
-        ticker = yf.Ticker(symbol)
-        info = ticker.info
-        return info.get('regularMarketPrice') is not None or info.get('previousClose') is not None
+        is_valid = await in_thread(lookup_symbol, symbol)
     except:
-        return False
+        is_valid = False
+
+    ttl = SYMBOL_VALID_TTL_SECONDS if is_valid else SYMBOL_INVALID_TTL_SECONDS
+    with symbol_validation_lock:
+        remember(symbol_validation_cache, symbol, now + ttl, is_valid, SYMBOL_VALIDATION_CACHE_MAX)
+    return is_valid
+
+async def validate_symbols_async(symbols):
+    return await asyncio.gather(*(validate_symbol_async(symbol) for symbol in symbols))
+
+def validate_symbol(symbol):
+    return run_upstream(validate_symbol_async(symbol))
+
+def validate_symbols(symbols):
+    """Validate several symbols concurrently, returning {symbol: valid}."""
+    unique = list(dict.fromkeys(symbols))
+    return dict(zip(unique, run_upstream(validate_symbols_async(unique))))
 
 @app.route('/')
 def index():
     return send_from_directory('.', 'index.html')
 
-@app.route('/api/competition', methods=['GET'])
-def get_competition():
-    data = load_competition()
-    if data:
-        return jsonify(data)
-    return jsonify(None)
+@app.route('/api/competition', methods=['GET'], defaults={'competition_id': DEFAULT_COMPETITION_ID})
+@app.route('/api/competitions/<competition_id>', methods=['GET'])
+def get_competition(competition_id):
+    data, version = load_competition_versioned(competition_id)
+    if not data:
+        # The default league answers null so the page can offer setup
+        if competition_id == DEFAULT_COMPETITION_ID:
+            return jsonify(None)
+        body, status = missing_competition(competition_id)
+        return jsonify(body), status
+
+    response = jsonify(data)
+    response.set_etag(version)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+@app.route('/api/competitions', methods=['GET'])
+def list_competitions():
+    """List every competition with the symbols it holds."""
+    return jsonify({'competitions': [
+        {
+            'id': competition_id,
+            'name': competition.get('name'),
+            'start_date': competition.get('start_date'),
+            'players': len(competition['players']),
+            'symbols': competition_symbols(competition)
+        }
+        for competition_id, (competition, _) in load_competitions().items()
+    ]})
 
 # Admin routes
 @app.route('/admin')
@@ -167,12 +1603,12 @@ def debug_env():
     """Temporary debug endpoint - remove after fixing"""
     # Test MongoDB write/read
     mongo_test = None
-    if db is not None:
+    if mongo() is not None:
         try:
             # Try to write a test document
-            db.test.replace_one({'_id': 'test'}, {'_id': 'test', 'value': 'works'}, upsert=True)
+            mongo().test.replace_one({'_id': 'test'}, {'_id': 'test', 'value': 'works'}, upsert=True)
             # Try to read it back
-            doc = db.test.find_one({'_id': 'test'})
+            doc = mongo().test.find_one({'_id': 'test'})
             mongo_test = 'read/write OK' if doc else 'write OK but read failed'
         except Exception as e:
             mongo_test = f'error: {str(e)}'
@@ -183,7 +1619,7 @@ def debug_env():
     return jsonify({
         'admin_password_length': len(ADMIN_PASSWORD),
         'admin_password_set': ADMIN_PASSWORD != 'cheesestick',
-        'mongodb_connected': db is not None,
+        'mongodb_connected': mongo() is not None,
         'mongodb_test': mongo_test,
         'mongodb_uri_set': MONGODB_URI is not None,
         'mongodb_uri_has_brackets': '<' in (MONGODB_URI or ''),
@@ -197,27 +1633,35 @@ def admin_logout():
     session.pop('admin', None)
     return jsonify({'success': True})
 
-@app.route('/api/admin/save', methods=['POST'])
-def admin_save():
+@app.route('/api/admin/save', methods=['POST'], defaults={'competition_id': DEFAULT_COMPETITION_ID})
+@app.route('/api/admin/save/<competition_id>', methods=['POST'])
+def admin_save(competition_id):
+    # Every extra league is another file and more symbols for the refresher
+    # to download, so only a logged-in admin may create or edit one
+    if competition_id != DEFAULT_COMPETITION_ID and not session.get('admin'):
+        return jsonify({'success': False, 'error': 'Admin login required'}), 401
+    if not COMPETITION_ID_PATTERN.match(competition_id):
+        return jsonify({'success': False, 'error': 'Competition ids may only use letters, digits, - and _'}), 400
+
     data = request.json
-    print(f"Saving competition: {data.get('name')} with {len(data.get('players', []))} players")
+    print(f"Saving competition {competition_id}: {data.get('name')} with {len(data.get('players', []))} players")
 
     try:
-        save_competition(data)
+        save_competition(data, competition_id)
 
         # Verify the save worked
-        loaded = load_competition()
+        loaded = load_competition(competition_id)
         if loaded and loaded.get('players'):
             return jsonify({
                 'success': True,
                 'saved_players': len(loaded.get('players', [])),
-                'storage': 'mongodb' if db is not None else 'file'
+                'storage': 'mongodb' if mongo() is not None else 'file'
             })
         else:
             return jsonify({
                 'success': False,
                 'error': 'Data did not persist after save',
-                'storage': 'mongodb' if db is not None else 'file'
+                'storage': 'mongodb' if mongo() is not None else 'file'
             }), 500
     except Exception as e:
         print(f"Save error: {e}")
@@ -228,26 +1672,77 @@ def validate_symbol_endpoint(symbol):
     is_valid = validate_symbol(symbol.upper())
     return jsonify({'valid': is_valid, 'symbol': symbol.upper()})
 
-@app.route('/api/performance', methods=['GET'])
-def get_performance():
-    competition = load_competition()
-    if not competition:
-        return jsonify({'error': 'No competition configured'}), 400
+@app.route('/api/validate-symbols', methods=['GET', 'POST'])
+def validate_symbols_endpoint():
+    """Validate a whole roster in one round trip.
+
+    Accepts ?symbols=AAPL,MSFT or a JSON body of {"symbols": [...]}.
+    """
+    if request.method == 'POST':
+        data = request.get_json(silent=True)
+        symbols = data.get('symbols') if isinstance(data, dict) else None
+        if not isinstance(symbols, list) or not all(isinstance(s, str) for s in symbols):
+            return jsonify({'error': 'Expected a JSON body of {"symbols": ["AAPL", ...]}'}), 400
+    else:
+        symbols = request.args.get('symbols', '').split(',')
 
-    start_date = competition['start_date']
-    players = competition['players']
-    allocation = competition['stock_allocation']
+    symbols = [str(s).upper().strip() for s in symbols if str(s).strip()]
+    if len(symbols) > MAX_VALIDATE_SYMBOLS:
+        return jsonify({'error': f'At most {MAX_VALIDATE_SYMBOLS} symbols per request'}), 400
+
+    results = validate_symbols(symbols)
+    return jsonify({
+        'results': results,
+        'invalid': [symbol for symbol, is_valid in results.items() if not is_valid]
+    })
 
-    # Collect all unique symbols
+def competition_symbols(competition):
+    """Collect all unique symbols held by any player."""
     all_symbols = set()
-    for player in players:
+    for player in competition['players']:
         all_symbols.update(player['longs'])
         all_symbols.add(player['short'])
-
-    # Fetch all stock data
-    prices = get_stock_data(list(all_symbols), start_date)
+    return sorted(all_symbols)
+
+def price_data_version(prices):
+    """Short digest that changes whenever any of the price series change."""
+    digest = hashlib.sha1()
+    for symbol in sorted(prices):
+        series = prices[symbol]
+        last_day = max(series) if series else ''
+        digest.update(f"{symbol}:{len(series)}:{last_day}:{series.get(last_day)};".encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+def missing_competition(competition_id):
+    """Error (body, status) for a competition id with nothing stored."""
+    if competition_id == DEFAULT_COMPETITION_ID:
+        return {'error': 'No competition configured'}, 400
+    return {'error': 'Competition not found'}, 404
+
+def build_analytics(competition_id, competition, version):
+    """Compute the shared analytics snapshot, returning (analytics, body, status).
+
+    The snapshot holds everything the performance, stock-details and
+    player-details payloads are built from: trading days, the forward-filled
+    price matrix, start prices, shares, daily portfolio values and period
+    reference indexes. It is reused for as long as neither the competition
+    nor the underlying prices change.
+
+    When prices can't be refreshed, the snapshot is built from the last
+    known good prices and marked stale, so it is served (flagged) while a
+    background revalidation retries.
+    """
+    prices, stale = load_prices(competition_symbols(competition), competition['start_date'])
     if not prices:
-        return jsonify({'error': 'Failed to fetch stock data'}), 500
+        return None, {'error': 'Failed to fetch stock data'}, 500
+
+    price_version = price_data_version(prices)
+    with analytics_lock:
+        current = analytics_snapshots.get(competition_id)
+        if current and current['versions'] == (version, price_version):
+            current['key'] = snapshot_key(version)
+            current['stale'] = stale
+            return current, current, 200
 
     # Find common trading days
     all_dates = set()
@@ -256,397 +1751,1414 @@ def get_performance():
     trading_days = sorted(all_dates)
 
     if not trading_days:
-        return jsonify({'error': 'No trading data available'}), 500
+        return None, {'error': 'No trading data available'}, 500
+
+    with timed('portfolio_values'):
+        values = compute_portfolio_values(prices, trading_days, competition['players'], competition['stock_allocation'])
+    analytics = {
+        'competition_id': competition_id,
+        'key': snapshot_key(version),
+        'versions': (version, price_version),
+        'etag': f"{version}-{price_version}",
+        'stale': stale,
+        'competition': competition,
+        'trading_days': trading_days,
+        'symbols': values['symbols'],
+        'sym_index': {symbol: j for j, symbol in enumerate(values['symbols'])},
+        'matrix': values['matrix'],
+        'start_prices': values['matrix'][0],
+        'shares': values['shares'],
+        'short_cols': values['short_cols'],
+        'long': values['long'],
+        'short_pnl': values['short_pnl'],
+        'total': values['long'] + values['short_pnl'],
+        'period_refs': {period: get_period_reference_index(trading_days, period) for period in PERIODS},
+        'payloads': {},        # name -> {'body', 'encoded'}
+        'replays': {},         # (frames, interpolation, include_short) -> {'etag', 'body', 'encoded'}
+        'player_details': {}   # player index -> body
+    }
+    with analytics_lock:
+        analytics_snapshots[competition_id] = analytics
+    publish_leaderboard(analytics)
+    return analytics, analytics, 200
+
+def get_analytics(competition_id=DEFAULT_COMPETITION_ID):
+    """Return (analytics, body, status), rebuilding the snapshot if it is stale."""
+    competition, version = load_competition_versioned(competition_id)
+    if not competition:
+        return (None,) + missing_competition(competition_id)
 
-    # Calculate performance for each player
-    performance = []
-    for player in players:
-        player_data = {
-            'name': player['name'],
-            'color': player['color'],
-            'history': []
-        }
+    with analytics_lock:
+        current = analytics_snapshots.get(competition_id)
+    count_cache('analytics', bool(current and current['key'] == snapshot_key(version)))
+    if current and current['key'] == snapshot_key(version):
+        analytics = current
+    else:
+        analytics, body, status = build_analytics(competition_id, competition, version)
+        if analytics is None:
+            return analytics, body, status
+
+    if analytics['stale']:
+        if has_request_context():
+            g.stale_as_of = analytics['trading_days'][-1]
+        revalidate_in_background(competition_id)
+    return analytics, analytics, 200
+
+def revalidate(competition_id):
+    """Retry a stale snapshot once the price provider accepts calls again."""
+    try:
+        time.sleep(circuit_retry_in('prices'))
+        competition, version = load_competition_versioned(competition_id)
+        if competition:
+            analytics, body, status = build_analytics(competition_id, competition, version)
+            print(f"Revalidated {competition_id}: {'still stale' if analytics is None or analytics['stale'] else 'fresh'}")
+    except Exception as e:
+        print(f"Revalidation error for {competition_id}: {e}")
+    finally:
+        with analytics_lock:
+            revalidating.discard(competition_id)
+
+def revalidate_in_background(competition_id):
+    """Start one revalidation per stale competition; later callers just serve the stale copy."""
+    with analytics_lock:
+        if competition_id in revalidating:
+            return
+        revalidating.add(competition_id)
+    threading.Thread(target=revalidate, args=(competition_id,), daemon=True).start()
 
-        # Get start prices (first available day)
-        first_day = trading_days[0]
-        start_prices = {}
-        for symbol in player['longs'] + [player['short']]:
-            if symbol in prices and first_day in prices[symbol]:
-                start_prices[symbol] = prices[symbol][first_day]
+def build_performance(analytics):
+    """Build the /api/performance payload."""
+    competition = analytics['competition']
+    trading_days = analytics['trading_days']
 
-        # Calculate shares bought at start
-        shares = {}
-        for symbol in player['longs']:
-            if symbol in start_prices:
-                shares[symbol] = allocation / start_prices[symbol]
-
-        short_symbol = player['short']
-        short_start_price = start_prices.get(short_symbol, 0)
-
-        # Calculate value for each trading day
-        for day in trading_days:
-            total_value = 0
-
-            # Long positions
-            for symbol in player['longs']:
-                if symbol in prices and day in prices[symbol] and symbol in shares:
-                    current_price = prices[symbol][day]
-                    total_value += shares[symbol] * current_price
-
-            # Short position - P&L only (no principal added)
-            # You "bet" $20K that the stock goes down
-            # If stock drops 50%, you gain $10K. If stock doubles, you lose $20K.
-            short_pnl = 0
-            if short_symbol in prices and day in prices[short_symbol] and short_start_price > 0:
-                current_price = prices[short_symbol][day]
-                price_change_pct = (current_price - short_start_price) / short_start_price
-                short_pnl = -price_change_pct * allocation  # Negative because short profits when price drops
-
-            player_data['history'].append({
+    performance = []
+    for i, player in enumerate(competition['players']):
+        history = []
+        for day, value, short_pnl in zip(trading_days, analytics['long'][i].tolist(), analytics['short_pnl'][i].tolist()):
+            history.append({
                 'date': day,
-                'value': round(total_value, 2),
-                'value_with_short': round(total_value + short_pnl, 2),
+                'value': round(value, 2),
+                'value_with_short': round(value + short_pnl, 2),
                 'short_pnl': round(short_pnl, 2)
             })
 
-        performance.append(player_data)
+        performance.append({
+            'name': player['name'],
+            'color': player['color'],
+            'history': history
+        })
 
-    return jsonify({
-        'start_date': start_date,
+    return {
+        'start_date': competition['start_date'],
         'trading_days': trading_days,
         'players': performance,
         'initial_investment': competition['initial_investment']
-    })
-
-@app.route('/api/stock-details', methods=['GET'])
-def get_stock_details():
-    """Get detailed breakdown of each player's positions."""
-    competition = load_competition()
-    if not competition:
-        return jsonify({'error': 'No competition configured'}), 400
+    }
+
+def build_positions(analytics, player, with_periods=False):
+    """Build a player's position breakdown as of the last trading day."""
+    allocation = analytics['competition']['stock_allocation']
+    matrix = analytics['matrix']
+    period_refs = analytics['period_refs']
+
+    def period_changes(j, current_price):
+        changes = {}
+        for period in PERIODS:
+            ref_price = matrix[period_refs[period], j]
+            if not np.isnan(ref_price):
+                changes[period] = ((current_price - ref_price) / ref_price) * 100
+        return changes
 
-    start_date = competition['start_date']
-    players = competition['players']
-    allocation = competition['stock_allocation']
+    positions = []
+    for symbol in player['longs']:
+        j = analytics['sym_index'][symbol]
+        start_price = float(matrix[0, j])
+        current_price = float(matrix[-1, j])
+        if np.isnan(start_price) or np.isnan(current_price):
+            continue
+
+        shares = allocation / start_price
+        position = {
+            'symbol': symbol,
+            'type': 'long',
+            'shares': round(shares, 4),
+            'start_price': round(start_price, 2),
+            'current_price': round(current_price, 2),
+            'current_value': round(shares * current_price, 2),
+            'gain_pct': round(((current_price - start_price) / start_price) * 100, 2)
+        }
+        if with_periods:
+            position['periods'] = {p: round(c, 2) for p, c in period_changes(j, current_price).items()}
+        positions.append(position)
 
-    # Collect all unique symbols
-    all_symbols = set()
-    for player in players:
-        all_symbols.update(player['longs'])
-        all_symbols.add(player['short'])
+    # Short position - P&L only
+    short_symbol = player['short']
+    j = analytics['sym_index'][short_symbol]
+    start_price = float(matrix[0, j])
+    current_price = float(matrix[-1, j])
+    if not (np.isnan(start_price) or np.isnan(current_price)):
+        price_change_pct = (current_price - start_price) / start_price
+        position = {
+            'symbol': short_symbol,
+            'type': 'short',
+            'start_price': round(start_price, 2),
+            'current_price': round(current_price, 2),
+            'current_value': round(-price_change_pct * allocation, 2),
+            'gain_pct': round(-price_change_pct * 100, 2)
+        }
+        if with_periods:
+            # For short, negative stock movement = positive return
+            position['periods'] = {p: round(-c, 2) for p, c in period_changes(j, current_price).items()}
+        positions.append(position)
 
-    prices = get_stock_data(list(all_symbols), start_date)
-    if not prices:
-        return jsonify({'error': 'Failed to fetch stock data'}), 500
+    return positions
 
-    trading_days = sorted(set().union(*[set(p.keys()) for p in prices.values()]))
-    if not trading_days:
-        return jsonify({'error': 'No trading data'}), 500
+def build_stock_details(analytics):
+    """Build the /api/stock-details payload."""
+    details = []
+    for player in analytics['competition']['players']:
+        details.append({
+            'name': player['name'],
+            'positions': build_positions(analytics, player)
+        })
 
-    first_day = trading_days[0]
-    last_day = trading_days[-1]
+    return {'players': details, 'as_of': analytics['trading_days'][-1]}
+
+def daily_returns(values):
+    """Day-over-day returns of a players x days value matrix."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        returns = values[:, 1:] / values[:, :-1] - 1
+    return np.where(np.isfinite(returns), returns, 0.0)
+
+def extend_risk_state(state, total):
+    """Fold the days of total (players x days) after state['days'] into new running statistics.
+
+    With state None everything is computed from scratch; otherwise only
+    the new days are touched. Returns a new state rather than changing the
+    old one, which other requests may still be reading.
+    """
+    players, days = total.shape
+    if state is None:
+        state = {
+            'days': 1,
+            'peak': total[:, 0].copy(),
+            'peak_index': np.zeros(players, dtype=int),
+            'max_drawdown': np.zeros(players),
+            'max_drawdown_peak': np.zeros(players, dtype=int),
+            'max_drawdown_trough': np.zeros(players, dtype=int),
+            'count': 0,
+            'sum': np.zeros(players),
+            'sumsq': np.zeros(players),
+            'cross': np.zeros((players, players)),
+            'best': np.full(players, -np.inf),
+            'best_index': np.zeros(players, dtype=int),
+            'worst': np.full(players, np.inf),
+            'worst_index': np.zeros(players, dtype=int),
+            'tail': np.zeros((players, 0)),
+            'rolling': np.zeros((players, 0)),
+            'last': total[:, 0].copy()
+        }
+    start = state['days']
+    if start >= days:
+        return state
+
+    values = total[:, start:]
+    index = np.arange(start, days)
+    returns = daily_returns(total[:, start - 1:])
+
+    # Running peak and the day it was set, continuing from the old peak
+    peak = np.maximum.accumulate(np.column_stack([state['peak'], values]), axis=1)[:, 1:]
+    new_peak = np.where(values >= peak, index, -1)
+    peak_index = np.maximum(np.maximum.accumulate(new_peak, axis=1), state['peak_index'][:, None])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        drawdown = np.where(peak > 0, values / peak - 1, 0.0)
+    trough = np.argmin(drawdown, axis=1)
+    deepest = drawdown[np.arange(players), trough]
+    deeper = deepest < state['max_drawdown']
+
+    best = np.argmax(returns, axis=1)
+    worst = np.argmin(returns, axis=1)
+    best_value = returns[np.arange(players), best]
+    worst_value = returns[np.arange(players), worst]
+
+    # Rolling volatility over windows ending on each new day
+    window = RISK_WINDOW_DAYS
+    recent = np.column_stack([state['tail'], returns])
+    rolling = state['rolling']
+    if recent.shape[1] >= window:
+        windows = np.lib.stride_tricks.sliding_window_view(recent, window, axis=1)
+        rolling = np.column_stack([rolling, windows.std(axis=2, ddof=1) * np.sqrt(TRADING_DAYS_PER_YEAR)])
+
+    return {
+        'days': days,
+        'peak': peak[:, -1],
+        'peak_index': peak_index[:, -1],
+        'max_drawdown': np.where(deeper, deepest, state['max_drawdown']),
+        'max_drawdown_peak': np.where(deeper, peak_index[np.arange(players), trough], state['max_drawdown_peak']),
+        'max_drawdown_trough': np.where(deeper, index[trough], state['max_drawdown_trough']),
+        'count': state['count'] + returns.shape[1],
+        'sum': state['sum'] + returns.sum(axis=1),
+        'sumsq': state['sumsq'] + (returns ** 2).sum(axis=1),
+        'cross': state['cross'] + returns @ returns.T,
+        'best': np.where(best_value > state['best'], best_value, state['best']),
+        'best_index': np.where(best_value > state['best'], index[best], state['best_index']),
+        'worst': np.where(worst_value < state['worst'], worst_value, state['worst']),
+        'worst_index': np.where(worst_value < state['worst'], index[worst], state['worst_index']),
+        'tail': recent[:, -(window - 1):],
+        'rolling': rolling,
+        'last': total[:, -1].copy()
+    }
+
+def risk_state_for(analytics):
+    """Running risk statistics for the analytics, extending the last ones when possible.
+
+    They are reused when the competition is unchanged and the values
+    already folded in still match, so a new trading day only processes
+    that day; edits or adjusted history trigger a full recompute.
+    """
+    competition_id = analytics['competition_id']
+    total = analytics['total']
+    previous = risk_states.get(competition_id)
+    if not (
+        previous
+        and previous['competition_version'] == analytics['versions'][0]
+        and previous['days'] <= total.shape[1]
+        and previous['first_day'] == analytics['trading_days'][0]
+        and np.allclose(previous['last'], total[:, previous['days'] - 1])
+    ):
+        previous = None
+
+    with timed('risk_state'):
+        state = extend_risk_state(previous, total)
+    state = dict(state, competition_version=analytics['versions'][0], first_day=analytics['trading_days'][0])
+    risk_states[competition_id] = state
+    return state
+
+def build_risk(analytics):
+    """Build the /api/risk payload: drawdown, volatility, Sharpe, best/worst day and correlation."""
+    state = risk_state_for(analytics)
+    trading_days = analytics['trading_days']
+    total = analytics['total']
+    annual = np.sqrt(TRADING_DAYS_PER_YEAR)
+
+    count = state['count']
+    mean = state['sum'] / count if count else np.zeros(len(total))
+    variance = (state['sumsq'] - count * mean ** 2) / (count - 1) if count > 1 else np.zeros(len(total))
+    std = np.sqrt(np.maximum(variance, 0))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sharpe = np.where(std > 0, (mean - RISK_FREE_RATE / TRADING_DAYS_PER_YEAR) / std * annual, 0.0)
+        covariance = (state['cross'] - count * np.outer(mean, mean)) / (count - 1) if count > 1 else np.zeros_like(state['cross'])
+        correlation = covariance / np.outer(std, std)
+    correlation = np.where(np.isfinite(correlation), correlation, 0.0)
+    np.fill_diagonal(correlation, 1.0)
+
+    current_drawdown = np.where(state['peak'] > 0, total[:, -1] / state['peak'] - 1, 0.0)
+    rolling = np.round(state['rolling'] * 100, 2).tolist()
+    players = []
+    for i, player in enumerate(analytics['competition']['players']):
+        players.append({
+            'name': player['name'],
+            'color': player['color'],
+            'max_drawdown_pct': round(float(state['max_drawdown'][i]) * 100, 2),
+            'max_drawdown_peak': trading_days[state['max_drawdown_peak'][i]],
+            'max_drawdown_trough': trading_days[state['max_drawdown_trough'][i]],
+            'current_drawdown_pct': round(float(current_drawdown[i]) * 100, 2),
+            'volatility_pct': round(float(std[i] * annual) * 100, 2),
+            'sharpe': round(float(sharpe[i]), 2),
+            'best_day': {
+                'date': trading_days[state['best_index'][i]],
+                'return_pct': round(float(state['best'][i]) * 100, 2)
+            } if count else None,
+            'worst_day': {
+                'date': trading_days[state['worst_index'][i]],
+                'return_pct': round(float(state['worst'][i]) * 100, 2)
+            } if count else None,
+            'rolling_volatility_pct': rolling[i]
+        })
 
-    details = []
-    for player in players:
-        player_detail = {
+    return {
+        'as_of': trading_days[-1],
+        'window': RISK_WINDOW_DAYS,
+        'risk_free_rate': RISK_FREE_RATE,
+        # rolling_volatility_pct[k] is for the window ending on trading day rolling_start + k
+        'rolling_start': trading_days[RISK_WINDOW_DAYS] if len(trading_days) > RISK_WINDOW_DAYS else None,
+        'players': players,
+        'correlation': np.round(correlation, 3).tolist()
+    }
+
+def build_replay(analytics, frames, interpolation, include_short):
+    """Build race-replay frames: each player's value and the ranking at
+    `frames` evenly spaced points of the season.
+
+    With 'step' interpolation frames land on trading days (so there are at
+    most as many frames as days); 'linear' interpolates values between days.
+    """
+    values = analytics['total'] if include_short else analytics['long']
+    trading_days = analytics['trading_days']
+    last = len(trading_days) - 1
+
+    positions = np.linspace(0, last, frames)
+    if interpolation == 'step':
+        positions = np.unique(np.round(positions)).astype(int)
+        frame_values = values[:, positions]
+    else:
+        lower = np.floor(positions).astype(int)
+        upper = np.minimum(lower + 1, last)
+        weight = positions - lower
+        frame_values = values[:, lower] * (1 - weight) + values[:, upper] * weight
+
+    frame_values = np.round(frame_values.T, 2)
+    return {
+        'frames': len(positions),
+        'interpolation': interpolation,
+        'include_short': include_short,
+        'players': [{'name': player['name'], 'color': player['color']} for player in analytics['competition']['players']],
+        'dates': [trading_days[int(position)] for position in positions],
+        'positions': np.round(positions, 3).tolist(),
+        'values': frame_values.tolist(),
+        'ranks': np.argsort(-frame_values, axis=1, kind='stable').tolist(),
+        'min': round(float(values.min()), 2),
+        'max': round(float(values.max()), 2)
+    }
+
+def columnar_performance(body):
+    """Reshape a performance payload into one array per series.
+
+    Each player's arrays line up with the top-level trading_days.
+    """
+    players = []
+    for player in body['players']:
+        history = player['history']
+        players.append({
             'name': player['name'],
-            'positions': []
+            'color': player['color'],
+            'value': [row['value'] for row in history],
+            'value_with_short': [row['value_with_short'] for row in history],
+            'short_pnl': [row['short_pnl'] for row in history]
+        })
+    return {**body, 'format': 'columnar', 'players': players}
+
+def performance_delta(body, version, since, client_version=None):
+    """Cut a performance payload down to the trading days after `since`.
+
+    Clients pass back the version token of the copy they hold; if it was
+    built for a different competition version, appending would be wrong,
+    so the full payload is returned with 'delta': False instead.
+    """
+    if client_version and client_version.split('-')[0] != version.split('-')[0]:
+        return {**body, 'delta': False, 'version': version}
+
+    start = bisect_right(body['trading_days'], since)
+    return {
+        'delta': True,
+        'since': since,
+        'version': version,
+        'start_date': body['start_date'],
+        'trading_days': body['trading_days'][start:],
+        'players': [
+            {
+                'name': player['name'],
+                'color': player['color'],
+                'history': player['history'][start:]
+            }
+            for player in body['players']
+        ],
+        'initial_investment': body['initial_investment']
+    }
+
+def lttb_indices(series, points):
+    """Pick indices that keep the shape of every series (Largest-Triangle-Three-Buckets).
+
+    `series` is a players x n array. The triangle areas of all series are
+    summed, so every player is downsampled onto the same x positions.
+    """
+    n = series.shape[1]
+    if points >= n:
+        return np.arange(n)
+    points = max(points, 3)
+
+    x = np.arange(n, dtype=float)
+    every = (n - 2) / (points - 2)
+    selected = [0]
+    a = 0
+    for bucket in range(points - 2):
+        start = int(bucket * every) + 1
+        end = int((bucket + 1) * every) + 1
+        next_end = min(int((bucket + 2) * every) + 1, n)
+
+        # Average of the next bucket (the last bucket looks at the end point)
+        if bucket == points - 3:
+            avg_x, avg_y = x[n - 1], series[:, n - 1]
+        else:
+            avg_x, avg_y = x[end:next_end].mean(), series[:, end:next_end].mean(axis=1)
+
+        candidates = series[:, start:end]
+        areas = np.abs(
+            (x[a] - avg_x) * (candidates - series[:, a:a + 1])
+            - (x[a] - x[start:end]) * (avg_y - series[:, a])[:, None]
+        ).sum(axis=0)
+        a = start + int(np.argmax(areas))
+        selected.append(a)
+
+    selected.append(n - 1)
+    return np.array(selected)
+
+def downsample_performance(body, points):
+    """Reduce a performance payload to about `points` days with LTTB."""
+    trading_days = body['trading_days']
+    if points >= len(trading_days) or not body['players']:
+        return body
+
+    values = np.array([[row['value_with_short'] for row in player['history']] for player in body['players']])
+    indices = lttb_indices(values, points).tolist()
+    return {
+        **body,
+        'downsampled_from': len(trading_days),
+        'trading_days': [trading_days[i] for i in indices],
+        'players': [
+            {**player, 'history': [player['history'][i] for i in indices]}
+            for player in body['players']
+        ]
+    }
+
+def performance_view(body, fmt='full', points=None):
+    """Apply ?points= downsampling and ?format= to a performance payload."""
+    if points:
+        body = downsample_performance(body, points)
+    return SNAPSHOT_FORMATS[fmt](body)
+
+def with_live_row(body, intraday):
+    """Append today's live value, from the latest intraday bar, to the history."""
+    session = intraday['times'][-1][:10]
+    players = []
+    for i, player in enumerate(body['players']):
+        value = float(intraday['long'][i, -1])
+        short_pnl = float(intraday['short_pnl'][i, -1])
+        players.append({**player, 'history': player['history'] + [{
+            'date': session,
+            'value': round(value, 2),
+            'value_with_short': round(value + short_pnl, 2),
+            'short_pnl': round(short_pnl, 2)
+        }]})
+
+    return {
+        **body,
+        'trading_days': body['trading_days'] + [session],
+        'players': players,
+        'live': {'date': session, 'time': intraday['times'][-1][11:], 'interval': INTRADAY_INTERVAL}
+    }
+
+def parse_points_arg():
+    points = request.args.get('points', type=int)
+    if points is None:
+        return None
+    return min(max(points, 3), MAX_CHART_POINTS)
+
+@app.route('/api/performance', methods=['GET'], defaults={'competition_id': DEFAULT_COMPETITION_ID})
+@app.route('/api/competitions/<competition_id>/performance', methods=['GET'])
+def get_performance(competition_id):
+    """Get every player's daily history.
+
+    Options:
+      ?format=columnar   parallel arrays per player instead of one object per day
+      ?since=YYYY-MM-DD  only the days after a date the client already has
+                         (pass back &version=<token> from the last response)
+      ?points=N          downsample to about N days with LTTB
+      ?intraday=1        append today's live value from intraday bars
+    """
+    snapshot, body, status = get_snapshot(competition_id, 'performance')
+    if snapshot is None:
+        return jsonify(body), status
+    fmt = 'columnar' if request.args.get('format') == 'columnar' else 'full'
+    points = parse_points_arg()
+    since = request.args.get('since')
+    intraday = request.args.get('intraday', '').lower() in ('1', 'true')
+
+    if since:
+        try:
+            datetime.strptime(since, '%Y-%m-%d')
+        except ValueError:
+            return jsonify({'error': 'since must be a YYYY-MM-DD date'}), 400
+
+    if not since and not intraday:
+        return snapshot_response(snapshot, fmt, points)
+
+    etag = snapshot['etag']
+    if intraday:
+        analytics, error, status = get_analytics(competition_id)
+        if analytics is None:
+            return jsonify(error), status
+        live = get_intraday_values(analytics)
+        if live is not None:
+            body = with_live_row(body, live)
+            etag = f"{etag}-live-{live['times'][-1]}"
+
+    if since:
+        body = performance_delta(body, etag, since, request.args.get('version'))
+
+    response = jsonify(performance_view(body, fmt, points))
+    response.set_etag(f"{etag}-{fmt}-{points}-since-{since}")
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+@app.route('/api/performance/intraday', methods=['GET'], defaults={'competition_id': DEFAULT_COMPETITION_ID})
+@app.route('/api/competitions/<competition_id>/performance/intraday', methods=['GET'])
+def get_performance_intraday(competition_id):
+    """Get every player's value through the current session at bar resolution.
+
+    Pass ?points=N to downsample the session with LTTB.
+    """
+    analytics, body, status = get_analytics(competition_id)
+    if analytics is None:
+        return jsonify(body), status
+
+    live = get_intraday_values(analytics)
+    players = analytics['competition']['players']
+    if live is None:
+        return jsonify({'session': None, 'interval': INTRADAY_INTERVAL, 'times': [], 'players': [
+            {'name': player['name'], 'color': player['color'], 'value': [], 'value_with_short': [], 'short_pnl': []}
+            for player in players
+        ]})
+
+    total = live['long'] + live['short_pnl']
+    points = parse_points_arg()
+    indices = lttb_indices(total, points) if points else np.arange(len(live['times']))
+
+    return jsonify({
+        'session': live['times'][-1][:10],
+        'interval': INTRADAY_INTERVAL,
+        'times': [live['times'][i] for i in indices.tolist()],
+        'players': [
+            {
+                'name': player['name'],
+                'color': player['color'],
+                'value': [round(v, 2) for v in live['long'][i, indices].tolist()],
+                'value_with_short': [round(v, 2) for v in total[i, indices].tolist()],
+                'short_pnl': [round(v, 2) for v in live['short_pnl'][i, indices].tolist()]
+            }
+            for i, player in enumerate(players)
+        ]
+    })
+
+@app.route('/api/stock-details', methods=['GET'], defaults={'competition_id': DEFAULT_COMPETITION_ID})
+@app.route('/api/competitions/<competition_id>/stock-details', methods=['GET'])
+def get_stock_details(competition_id):
+    """Get detailed breakdown of each player's positions."""
+    snapshot, body, status = get_snapshot(competition_id, 'stock-details')
+    if snapshot is None:
+        return jsonify(body), status
+    return snapshot_response(snapshot)
+
+@app.route('/api/risk', methods=['GET'], defaults={'competition_id': DEFAULT_COMPETITION_ID})
+@app.route('/api/competitions/<competition_id>/risk', methods=['GET'])
+def get_risk(competition_id):
+    """Get each player's drawdown, volatility, Sharpe ratio, best and worst day,
+    and the correlation of players' daily returns."""
+    snapshot, body, status = get_snapshot(competition_id, 'risk')
+    if snapshot is None:
+        return jsonify(body), status
+    return snapshot_response(snapshot)
+
+@app.route('/api/replay', methods=['GET'], defaults={'competition_id': DEFAULT_COMPETITION_ID})
+@app.route('/api/competitions/<competition_id>/replay', methods=['GET'])
+def get_replay(competition_id):
+    """Get precomputed race-replay frames.
+
+    Query args: frames (default DEFAULT_REPLAY_FRAMES), interpolation
+    ('step' or 'linear') and short ('false' to rank on longs only).
+    """
+    frames = min(max(request.args.get('frames', DEFAULT_REPLAY_FRAMES, type=int), 2), MAX_REPLAY_FRAMES)
+    interpolation = request.args.get('interpolation', 'step')
+    if interpolation not in ('step', 'linear'):
+        return jsonify({'error': "interpolation must be 'step' or 'linear'"}), 400
+    include_short = request.args.get('short', 'true').lower() != 'false'
+
+    analytics, body, status = get_analytics(competition_id)
+    if analytics is None:
+        return jsonify(body), status
+
+    key = (frames, interpolation, include_short)
+    snapshot = analytics['replays'].get(key)
+    count_cache('replay', snapshot is not None)
+    if snapshot is None:
+        with timed('build_replay'):
+            body = build_replay(analytics, frames, interpolation, include_short)
+        snapshot = {
+            'etag': f"{analytics['etag']}-replay-{frames}-{interpolation}-{int(include_short)}",
+            'body': body,
+            'encoded': {}
+        }
+        if len(analytics['replays']) < MAX_REPLAY_VIEWS:
+            analytics['replays'][key] = snapshot
+    return snapshot_response(snapshot)
+
+# Analytics snapshots per competition, keyed by the competition version and
+# the trading day they were built for. Prices before today never change, so it
+# stays good until the day rolls over or the competition is edited.
+# Payloads built from it also keep their serialized and compressed bodies
+# so repeat requests skip JSON encoding entirely.
+PERIODS = ['all', 'month', 'week', 'day']
+SNAPSHOT_BUILDERS = {
+    'performance': build_performance,
+    'stock-details': build_stock_details,
+    'risk': build_risk
+}
+SNAPSHOT_FORMATS = {
+    'full': lambda body: body,
+    'columnar': columnar_performance
+}
+MAX_ENCODED_VIEWS = 32
+MAX_CHART_POINTS = 5000
+DEFAULT_REPLAY_FRAMES = 60
+MAX_REPLAY_FRAMES = 2000
+MAX_REPLAY_VIEWS = 16
+analytics_snapshots = {}  # competition id -> analytics
+analytics_lock = threading.Lock()
+
+# Latest compact leaderboard per competition, shared by every stream and
+# long-poll client of that competition
+LEADERBOARD_STREAM_SECONDS = int(os.environ.get('LEADERBOARD_STREAM_SECONDS', 300))
+LEADERBOARD_KEEPALIVE_SECONDS = 15
+LEADERBOARD_LONG_POLL_SECONDS = 25
+LEADERBOARD_RETRY_MS = 5000
+# Every waiting stream or long-poll holds a request thread, so at most
+# LEADERBOARD_MAX_WAITERS per worker wait at once (a quarter of a gthread
+# worker's threads, none on a sync worker). Everyone else gets an immediate
+# answer and polls. The leaderboard only moves during the day while the
+# background refresher publishes intraday standings in market hours;
+# otherwise it changes when the day rolls over, so nobody waits at all.
+LEADERBOARD_MAX_WAITERS = int(os.environ.get(
+    'LEADERBOARD_MAX_WAITERS',
+    0 if os.environ.get('GUNICORN_WORKER_CLASS', 'gthread') == 'sync' else int(os.environ.get('GUNICORN_THREADS', 8)) // 4
+))
+leaderboard_slots = threading.Semaphore(LEADERBOARD_MAX_WAITERS)
+leaderboard_states = {}  # competition id -> {'version', 'seq', 'data', 'message'}
+leaderboard_condition = threading.Condition()
+
+def snapshot_key(version):
+    return (datetime.now().strftime('%Y-%m-%d'), version)
+
+def get_snapshot(competition_id, name):
+    """Return (snapshot, body, status) for a payload built from the analytics."""
+    analytics, body, status = get_analytics(competition_id)
+    if analytics is None:
+        return None, body, status
+
+    snapshot = analytics['payloads'].get(name)
+    count_cache('payload', snapshot is not None)
+    if snapshot is None:
+        with timed('build_payload'):
+            body = SNAPSHOT_BUILDERS[name](analytics)
+        snapshot = {
+            'etag': analytics['etag'],
+            'body': body,
+            'encoded': {}  # (format, points, encoding) -> bytes
+        }
+        analytics['payloads'][name] = snapshot
+    return snapshot, snapshot['body'], 200
+
+def price_marks(symbols):
+    """Per-symbol (covered end, price count), to spot which series a fetch changed."""
+    with price_cache_lock:
+        return {
+            symbol: (price_cache[symbol]['end'], len(price_cache[symbol]['prices'])) if symbol in price_cache else None
+            for symbol in symbols
         }
 
-        for symbol in player['longs']:
-            if symbol in prices and first_day in prices[symbol] and last_day in prices[symbol]:
-                start_price = prices[symbol][first_day]
-                current_price = prices[symbol][last_day]
-                shares = allocation / start_price
-                current_value = shares * current_price
-                gain_pct = ((current_price - start_price) / start_price) * 100
-
-                player_detail['positions'].append({
-                    'symbol': symbol,
-                    'type': 'long',
-                    'shares': round(shares, 4),
-                    'start_price': round(start_price, 2),
-                    'current_price': round(current_price, 2),
-                    'current_value': round(current_value, 2),
-                    'gain_pct': round(gain_pct, 2)
-                })
+def leaderboard_live():
+    """Whether the leaderboard can change before the day rolls over."""
+    return BACKGROUND_REFRESH and is_market_open()
+
+def refresh_snapshots():
+    """Rebuild analytics and payload snapshots from freshly fetched prices.
+
+    Prices are fetched once for the pool of every competition's symbols, so
+    a ticker shared by several leagues is refreshed once. Only competitions
+    holding a symbol whose prices changed (or whose snapshot is stale) are
+    rebuilt.
+    """
+    competitions = load_competitions()
+    if not competitions:
+        return
+
+    index = symbol_competition_index(competitions)
+    before = price_marks(index)
+    get_stock_data(sorted(index), min(competition['start_date'] for competition, _ in competitions.values()))
+    after = price_marks(index)
+
+    changed = {competition_id for symbol in index if before[symbol] != after[symbol] for competition_id in index[symbol]}
+    for competition_id, (competition, version) in competitions.items():
+        if competition_id not in changed and not snapshots_stale(competition_id):
+            continue
+        analytics, body, status = build_analytics(competition_id, competition, version)
+        if analytics is None:
+            print(f"Snapshot refresh failed for {competition_id}: {body.get('error')}")
+            continue
+        for name in SNAPSHOT_BUILDERS:
+            get_snapshot(competition_id, name)
+
+def publish_live_leaderboards():
+    """Publish standings valued at the latest intraday bar for every competition.
+
+    Daily closes don't change during the session, so this is what moves
+    the leaderboard in market hours.
+    """
+    for competition_id in list_competition_ids():
+        analytics, body, status = get_analytics(competition_id)
+        if analytics is None:
+            continue
+        live = get_intraday_values(analytics)
+        if live is not None:
+            publish_leaderboard(analytics, live)
+
+def encoded_snapshot(snapshot, fmt, encoding, points=None):
+    """Serialize (and compress) a snapshot body once per view and encoding."""
+    key = (fmt, points, encoding)
+    data = snapshot['encoded'].get(key)
+    if data is None:
+        if encoding == 'identity':
+            body = performance_view(snapshot['body'], fmt, points)
+            with timed('serialize'):
+                data = app.json.dumps(body).encode('utf-8')
+        else:
+            data = compress_body(encoded_snapshot(snapshot, fmt, 'identity', points), encoding)
+        # Arbitrary ?points= values shouldn't grow the cache without bound
+        if len(snapshot['encoded']) < MAX_ENCODED_VIEWS:
+            snapshot['encoded'][key] = data
+    return data
+
+def snapshot_response(snapshot, fmt='full', points=None):
+    """Serve a snapshot with an ETag, answering 304 when the client is current."""
+    etag = snapshot['etag']
+    if fmt != 'full':
+        etag += f"-{fmt}"
+    if points:
+        etag += f"-points{points}"
+
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        data = encoded_snapshot(snapshot, fmt, 'identity', points)
+        encoding = preferred_encoding() if len(data) >= COMPRESS_MIN_BYTES else 'identity'
+        if encoding != 'identity':
+            data = encoded_snapshot(snapshot, fmt, encoding, points)
+        response = app.response_class(data, mimetype='application/json')
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.vary.add('Accept-Encoding')
+    return response
+
+def build_leaderboard(analytics, live=None):
+    """Compact standings: each player's latest value and rank move since the previous day.
+
+    With live intraday values (see get_intraday_values) the latest bar is
+    ranked against the last daily close.
+    """
+    players = analytics['competition']['players']
+    totals = analytics['total']
+    if live is None:
+        values = analytics['long'][:, -1]
+        latest = totals[:, -1]
+        previous = totals[:, -2] if totals.shape[1] > 1 else latest
+        version, as_of = analytics['etag'], analytics['trading_days'][-1]
+    else:
+        values = live['long'][:, -1]
+        latest = values + live['short_pnl'][:, -1]
+        previous = totals[:, -1]
+        version, as_of = f"{analytics['etag']}-{live['times'][-1].replace(' ', 'T')}", live['times'][-1]
+
+    ranks = {i: rank for rank, i in enumerate(np.argsort(-latest, kind='stable').tolist(), start=1)}
+    previous_ranks = {i: rank for rank, i in enumerate(np.argsort(-previous, kind='stable').tolist(), start=1)}
+
+    standings = []
+    for i in sorted(ranks, key=ranks.get):
+        standings.append({
+            'index': i,
+            'name': players[i]['name'],
+            'value': round(float(values[i]), 2),
+            'value_with_short': round(float(latest[i]), 2),
+            'rank': ranks[i],
+            'move': previous_ranks[i] - ranks[i]
+        })
 
-        # Short position - P&L only
-        short_symbol = player['short']
-        if short_symbol in prices and first_day in prices[short_symbol] and last_day in prices[short_symbol]:
-            start_price = prices[short_symbol][first_day]
-            current_price = prices[short_symbol][last_day]
-            price_change_pct = (current_price - start_price) / start_price
-            short_pnl = -price_change_pct * allocation
-
-            player_detail['positions'].append({
-                'symbol': short_symbol,
-                'type': 'short',
-                'start_price': round(start_price, 2),
-                'current_price': round(current_price, 2),
-                'current_value': round(short_pnl, 2),
-                'gain_pct': round(-price_change_pct * 100, 2)
-            })
+    return {
+        'version': version,
+        'as_of': as_of,
+        'players': standings
+    }
+
+def publish_leaderboard(analytics, live=None):
+    """Hand a new leaderboard to every waiting stream and long-poll client."""
+    update = build_leaderboard(analytics, live)
+    with leaderboard_condition:
+        leaderboard_state = leaderboard_states.setdefault(
+            analytics['competition_id'], {'version': None, 'seq': 0, 'data': None, 'message': None}
+        )
+        if leaderboard_state['version'] == update['version']:
+            return
+        # Encoded once here, not once per connection
+        message = f"event: leaderboard\nid: {update['version']}\ndata: {json.dumps(update, separators=(',', ':'))}\n\n"
+        leaderboard_state.update(
+            version=update['version'],
+            seq=leaderboard_state['seq'] + 1,
+            data=update,
+            message=message.encode('utf-8')
+        )
+        leaderboard_condition.notify_all()
+
+def wait_for_leaderboard(competition_id, seq, timeout):
+    """Block until the leaderboard moves past `seq` or timeout, returning the latest state."""
+    with leaderboard_condition:
+        leaderboard_condition.wait_for(lambda: leaderboard_states[competition_id]['seq'] != seq, timeout=timeout)
+        return dict(leaderboard_states[competition_id])
+
+@app.route('/api/leaderboard/stream', methods=['GET'], defaults={'competition_id': DEFAULT_COMPETITION_ID})
+@app.route('/api/competitions/<competition_id>/leaderboard/stream', methods=['GET'])
+def leaderboard_stream(competition_id):
+    """Server-Sent Events stream of leaderboard updates.
+
+    Each connection holds a request thread, so streams end after
+    LEADERBOARD_STREAM_SECONDS and EventSource reconnects on its own. With
+    no free slot (or while the leaderboard can't change, see
+    leaderboard_live) the answer is 204, which tells EventSource to stop;
+    the client polls /api/leaderboard instead.
+    """
+    analytics, body, status = get_analytics(competition_id)
+    if analytics is None:
+        return jsonify(body), status
+    if not leaderboard_live() or not leaderboard_slots.acquire(blocking=False):
+        return '', 204
+
+    def events():
+        yield f"retry: {LEADERBOARD_RETRY_MS}\n\n".encode('utf-8')
+        seq = None
+        deadline = time.time() + LEADERBOARD_STREAM_SECONDS
+        while time.time() < deadline:
+            state = wait_for_leaderboard(competition_id, seq, min(LEADERBOARD_KEEPALIVE_SECONDS, deadline - time.time()))
+            if state['seq'] != seq:
+                seq = state['seq']
+                yield state['message']
+            else:
+                yield b": keepalive\n\n"
 
-        details.append(player_detail)
+    response = app.response_class(events(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+    response.call_on_close(leaderboard_slots.release)
+    return response
+
+@app.route('/api/leaderboard', methods=['GET'], defaults={'competition_id': DEFAULT_COMPETITION_ID})
+@app.route('/api/competitions/<competition_id>/leaderboard', methods=['GET'])
+def get_leaderboard(competition_id):
+    """Long-poll fallback for the leaderboard stream.
+
+    With ?version=<token> the request waits (up to ?wait= seconds) until
+    the leaderboard differs from that version, if a waiting slot is free.
+    'live' says whether it can change before the day rolls over at all.
+    """
+    analytics, body, status = get_analytics(competition_id)
+    if analytics is None:
+        return jsonify(body), status
+
+    state = wait_for_leaderboard(competition_id, None, 0)
+    client_version = request.args.get('version')
+    live = leaderboard_live()
+    if (client_version and client_version == state['version'] and live
+            and leaderboard_slots.acquire(blocking=False)):
+        try:
+            wait_seconds = min(request.args.get('wait', LEADERBOARD_LONG_POLL_SECONDS, type=float), LEADERBOARD_LONG_POLL_SECONDS)
+            state = wait_for_leaderboard(competition_id, state['seq'], max(wait_seconds, 0))
+        finally:
+            leaderboard_slots.release()
+
+    return jsonify({**state['data'], 'live': live})
+
+def snapshots_stale(competition_id=None):
+    """Whether a competition's snapshot (or, without an id, any one) needs rebuilding."""
+    competition_ids = [competition_id] if competition_id else list_competition_ids()
+    for competition_id in competition_ids:
+        competition, version = load_competition_versioned(competition_id)
+        if not competition:
+            continue
+        with analytics_lock:
+            current = analytics_snapshots.get(competition_id)
+        if current is None or current['key'] != snapshot_key(version) or current['stale']:
+            return True
+    return False
+
+def is_market_open():
+    """Check whether US equity markets are in regular trading hours."""
+    now = datetime.now(MARKET_TIMEZONE)
+    if not is_trading_day(now):
+        return False
+    minutes = now.hour * 60 + now.minute
+    return 9 * 60 + 30 <= minutes < 16 * 60
 
-    return jsonify({'players': details, 'as_of': last_day})
+def background_refresh_loop():
+    while True:
+        try:
+            # Daily closes only move when the day rolls over (or a fetch
+            # failed); during the session the leaderboard follows intraday bars
+            if snapshots_stale():
+                refresh_snapshots()
+            if is_market_open():
+                publish_live_leaderboards()
+        except Exception as e:
+            print(f"Background refresh error: {e}")
+        time.sleep(REFRESH_INTERVAL_SECONDS)
+
+def warm_caches():
+    """Load prices and build every competition's snapshots ahead of the first request.
+
+    Run in the gunicorn master when PRELOAD is set (see gunicorn.conf.py),
+    so forked workers start with warm caches and share them, along with
+    yfinance and pandas, copy-on-write.
+    """
+    started = time.perf_counter()
+    importlib.import_module('yfinance')
+    load_price_cache()
+    try:
+        refresh_snapshots()
+    except Exception as e:
+        print(f"Cache warm-up error: {e}")
+    print(f"Caches warmed in {time.perf_counter() - started:.1f}s")
+
+@app.before_request
+def start_background_refresher():
+    """Start the refresher thread in this worker on its first request."""
+    global refresher_pid
+    if not BACKGROUND_REFRESH or refresher_pid == os.getpid():
+        return
+    with analytics_lock:
+        if refresher_pid == os.getpid():
+            return
+        refresher_pid = os.getpid()
+    threading.Thread(target=background_refresh_loop, daemon=True).start()
+    print(f"Background price refresh every {REFRESH_INTERVAL_SECONDS}s")
 
-def fetch_yahoo_rss_news(symbol):
+async def fetch_yahoo_rss_news(symbol):
     """Fetch news from Yahoo Finance RSS feed."""
     news_items = []
+    if not circuit_allows('yahoo_rss'):
+        return news_items
     try:
         url = f"https://feeds.finance.yahoo.com/rss/2.0/headline?s={symbol}&region=US&lang=en-US"
-        req = urllib.request.Request(url, headers={'User-Agent': 'Mozilla/5.0'})
-        with urllib.request.urlopen(req, timeout=5) as response:
-            xml_data = response.read()
-            root = ET.fromstring(xml_data)
-
-            for item in root.findall('.//item')[:5]:
-                title = item.find('title')
-                link = item.find('link')
-                pub_date = item.find('pubDate')
-
-                if title is not None and title.text:
-                    # Parse date
-                    published = 0
-                    if pub_date is not None and pub_date.text:
-                        try:
-                            dt = datetime.strptime(pub_date.text, '%a, %d %b %Y %H:%M:%S %z')
-                            published = int(dt.timestamp())
-                        except:
-                            published = int(datetime.now().timestamp())
-
-                    news_items.append({
-                        'symbol': symbol,
-                        'title': title.text,
-                        'publisher': 'Yahoo Finance',
-                        'link': link.text if link is not None else '',
-                        'published': published
-                    })
+        try:
+            with upstream_call('yahoo_rss'):
+                response = await http_client().get(url)
+                response.raise_for_status()
+        except Exception:
+            record_circuit('yahoo_rss', False)
+            raise
+        record_circuit('yahoo_rss', True)
+        root = ET.fromstring(response.content)
+
+        for item in root.findall('.//item')[:5]:
+            title = item.find('title')
+            link = item.find('link')
+            pub_date = item.find('pubDate')
+
+            if title is not None and title.text:
+                # Parse date
+                published = 0
+                if pub_date is not None and pub_date.text:
+                    try:
+                        dt = datetime.strptime(pub_date.text, '%a, %d %b %Y %H:%M:%S %z')
+                        published = int(dt.timestamp())
+                    except:
+                        published = int(datetime.now().timestamp())
+
+                news_items.append({
+                    'symbol': symbol,
+                    'title': title.text,
+                    'publisher': 'Yahoo Finance',
+                    'link': link.text if link is not None else '',
+                    'published': published
+                })
     except Exception as e:
         print(f"RSS error for {symbol}: {e}")
 
     return news_items
 
+def fetch_ticker_news(symbol):
+    import yfinance as yf
+
+    with upstream_call('yfinance_news'):
+        return yf.Ticker(symbol).news
+
+async def fetch_symbol_news(symbol):
+    """Fetch news for one symbol, using the per-symbol TTL cache."""
+    now = time.time()
+    with news_cache_lock:
+        cached = news_cache.get(symbol)
+        if cached:
+            news_cache.move_to_end(symbol)
+    count_cache('news', bool(cached and cached[0] > now))
+    if cached and cached[0] > now:
+        return cached[1]
+
+    # Try Yahoo RSS first
+    items = await fetch_yahoo_rss_news(symbol)
+
+    # Also try yfinance as backup
+    if len(items) < 2:
+        try:
+            news = await in_thread(fetch_ticker_news, symbol)
+            if news:
+                for item in news[:3]:
+                    title = item.get('title', '')
+                    if title:
+                        items.append({
+                            'symbol': symbol,
+                            'title': title,
+                            'publisher': item.get('publisher', 'Unknown'),
+                            'link': item.get('link', ''),
+                            'published': item.get('providerPublishTime', 0)
+                        })
+        except Exception as e:
+            print(f"yfinance news error for {symbol}: {e}")
+
+    # Don't hold on to an empty result for long - the feed may just be slow
+    ttl = NEWS_CACHE_TTL_SECONDS if items else min(NEWS_CACHE_TTL_SECONDS, 60)
+    with news_cache_lock:
+        remember(news_cache, symbol, now + ttl, items, NEWS_CACHE_MAX_SYMBOLS)
+    return items
+
+async def gather_news(symbols):
+    """News lists for whichever symbols finish within NEWS_DEADLINE_SECONDS.
+
+    Anything slower keeps running and lands in the cache for next time.
+    """
+    tasks = [asyncio.ensure_future(fetch_symbol_news(symbol)) for symbol in symbols]
+    done, pending = await asyncio.wait(tasks, timeout=NEWS_DEADLINE_SECONDS)
+    for task in pending:
+        keep_running(task)
+    return [task.result() for task in tasks if task in done and task.exception() is None]
+
 @app.route('/api/news/<symbols>', methods=['GET'])
 def get_news(symbols):
     """Get news for multiple stock symbols using multiple sources."""
-    symbol_list = symbols.upper().split(',')
-    all_news = []
+    symbol_list = symbols.upper().split(',')[:6]
 
-    for symbol in symbol_list[:6]:
-        # Try Yahoo RSS first
-        rss_news = fetch_yahoo_rss_news(symbol)
-        all_news.extend(rss_news)
-
-        # Also try yfinance as backup
-        if len(rss_news) < 2:
-            try:
-                ticker = yf.Ticker(symbol)
-                news = ticker.news
-                if news:
-                    for item in news[:3]:
-                        title = item.get('title', '')
-                        # Avoid duplicates
-                        if title and not any(n['title'] == title for n in all_news):
-                            all_news.append({
-                                'symbol': symbol,
-                                'title': title,
-                                'publisher': item.get('publisher', 'Unknown'),
-                                'link': item.get('link', ''),
-                                'published': item.get('providerPublishTime', 0)
-                            })
-            except Exception as e:
-                print(f"yfinance news error for {symbol}: {e}")
+    all_news = []
+    seen_titles = set()
+    for items in run_upstream(gather_news(symbol_list)):
+        for item in items:
+            # Avoid duplicates
+            if item['title'] not in seen_titles:
+                seen_titles.add(item['title'])
+                all_news.append(item)
 
     # Sort by publish time, newest first
     all_news.sort(key=lambda x: x['published'], reverse=True)
 
     return jsonify({'news': all_news[:12]})
 
-def calculate_portfolio_value(prices, player, allocation, ref_day, current_day):
-    """Calculate portfolio value between two dates."""
-    total = 0
-
-    # Long positions
-    for symbol in player['longs']:
-        if symbol in prices and ref_day in prices[symbol] and current_day in prices[symbol]:
-            start_price = prices[symbol][ref_day]
-            current_price = prices[symbol][current_day]
-            shares = allocation / prices[symbol][ref_day] if ref_day == list(prices[symbol].keys())[0] else allocation / start_price
-            # Actually we need shares from competition start
-            first_day = sorted(prices[symbol].keys())[0]
-            if first_day in prices[symbol]:
-                shares = allocation / prices[symbol][first_day]
-                total += shares * prices[symbol][current_day]
-
-    return total
-
-def get_period_reference_day(trading_days, period):
-    """Get the reference day for a given period."""
-    if not trading_days:
-        return None
-
-    last_day = trading_days[-1]
-    last_date = datetime.strptime(last_day, '%Y-%m-%d')
-
+def get_period_reference_index(trading_days, period):
+    """Get the index of the reference day for a given period."""
     if period == 'all':
-        return trading_days[0]
-    elif period == 'month':
+        return 0
+
+    last_date = datetime.strptime(trading_days[-1], '%Y-%m-%d')
+    if period == 'month':
         target = last_date - timedelta(days=30)
     elif period == 'week':
         target = last_date - timedelta(days=7)
     elif period == 'day':
         target = last_date - timedelta(days=1)
     else:
-        return trading_days[0]
-
-    target_str = target.strftime('%Y-%m-%d')
-
-    # Find closest trading day on or before target
-    for day in reversed(trading_days):
-        if day <= target_str:
-            return day
-
-    return trading_days[0]
+        return 0
 
-@app.route('/api/player-details/<int:player_index>', methods=['GET'])
-def get_player_details(player_index):
-    """Get detailed info for a specific player with period-based performance."""
-    competition = load_competition()
-    if not competition:
-        return jsonify({'error': 'No competition configured'}), 400
-
-    if player_index < 0 or player_index >= len(competition['players']):
-        return jsonify({'error': 'Invalid player index'}), 400
+    # Closest trading day on or before target
+    index = bisect_right(trading_days, target.strftime('%Y-%m-%d')) - 1
+    return max(index, 0)
 
+def build_player_details(analytics, player_index):
+    """Build the /api/player-details payload for one player."""
+    competition = analytics['competition']
     player = competition['players'][player_index]
-    start_date = competition['start_date']
-    allocation = competition['stock_allocation']
     initial_investment = competition['initial_investment']
-
-    # Get all symbols for this player
-    all_symbols = player['longs'] + [player['short']]
-
-    # Fetch price data
-    prices = get_stock_data(all_symbols, start_date)
-    if not prices:
-        return jsonify({'error': 'Failed to fetch stock data'}), 500
-
-    trading_days = sorted(set().union(*[set(p.keys()) for p in prices.values()]))
-    if not trading_days:
-        return jsonify({'error': 'No trading data'}), 500
-
-    first_day = trading_days[0]
-    last_day = trading_days[-1]
-
-    # Calculate current total portfolio value
-    def calc_total_value(ref_day):
-        total = 0
-        # Longs
-        for symbol in player['longs']:
-            if symbol in prices and first_day in prices[symbol] and ref_day in prices[symbol]:
-                shares = allocation / prices[symbol][first_day]
-                total += shares * prices[symbol][ref_day]
-        # Short P&L
-        short_symbol = player['short']
-        if short_symbol in prices and first_day in prices[short_symbol] and ref_day in prices[short_symbol]:
-            short_start = prices[short_symbol][first_day]
-            short_current = prices[short_symbol][ref_day]
-            price_change_pct = (short_current - short_start) / short_start
-            total += -price_change_pct * allocation
-        return total
+    total = analytics['total'][player_index]
+    end_value = float(total[-1])
 
     # Calculate period-based performance
     period_performance = {}
-    for period in ['all', 'month', 'week', 'day']:
-        ref_day = get_period_reference_day(trading_days, period)
-        if ref_day:
-            start_value = calc_total_value(ref_day) if period != 'all' else initial_investment
-            end_value = calc_total_value(last_day)
-
-            if period == 'all':
-                change = end_value - initial_investment
-                change_pct = ((end_value - initial_investment) / initial_investment) * 100
-            else:
-                change = end_value - start_value
-                change_pct = ((end_value - start_value) / start_value) * 100 if start_value > 0 else 0
+    for period in PERIODS:
+        if period == 'all':
+            change = end_value - initial_investment
+            change_pct = (change / initial_investment) * 100
+        else:
+            start_value = float(total[analytics['period_refs'][period]])
+            change = end_value - start_value
+            change_pct = (change / start_value) * 100 if start_value > 0 else 0
+
+        period_performance[period] = {
+            'value': round(end_value, 2),
+            'change': round(change, 2),
+            'change_pct': round(change_pct, 2)
+        }
 
-            period_performance[period] = {
-                'value': round(end_value, 2),
-                'change': round(change, 2),
-                'change_pct': round(change_pct, 2)
-            }
+    return {
+        'name': player['name'],
+        'color': player['color'],
+        'positions': build_positions(analytics, player, with_periods=True),
+        'symbols': player['longs'] + [player['short']],
+        'performance': period_performance,
+        'as_of': analytics['trading_days'][-1]
+    }
 
-    positions = []
+@app.route('/api/player-details/<int:player_index>', methods=['GET'], defaults={'competition_id': DEFAULT_COMPETITION_ID})
+@app.route('/api/competitions/<competition_id>/player-details/<int:player_index>', methods=['GET'])
+def get_player_details(competition_id, player_index):
+    """Get detailed info for a specific player with period-based performance."""
+    analytics, body, status = get_analytics(competition_id)
+    if analytics is None:
+        return jsonify(body), status
 
-    # Long positions with period data
-    for symbol in player['longs']:
-        if symbol in prices and first_day in prices[symbol] and last_day in prices[symbol]:
-            start_price = prices[symbol][first_day]
-            current_price = prices[symbol][last_day]
-            shares = allocation / start_price
-            current_value = shares * current_price
-            gain_pct = ((current_price - start_price) / start_price) * 100
-
-            # Calculate period changes for this position
-            pos_periods = {}
-            for period in ['all', 'month', 'week', 'day']:
-                ref_day = get_period_reference_day(trading_days, period)
-                if ref_day and ref_day in prices[symbol]:
-                    ref_price = prices[symbol][ref_day]
-                    period_change = ((current_price - ref_price) / ref_price) * 100
-                    pos_periods[period] = round(period_change, 2)
-
-            positions.append({
-                'symbol': symbol,
-                'type': 'long',
-                'shares': round(shares, 4),
-                'start_price': round(start_price, 2),
-                'current_price': round(current_price, 2),
-                'current_value': round(current_value, 2),
-                'gain_pct': round(gain_pct, 2),
-                'periods': pos_periods
-            })
+    if player_index < 0 or player_index >= len(analytics['competition']['players']):
+        return jsonify({'error': 'Invalid player index'}), 400
 
-    # Short position
-    short_symbol = player['short']
-    if short_symbol in prices and first_day in prices[short_symbol] and last_day in prices[short_symbol]:
-        start_price = prices[short_symbol][first_day]
-        current_price = prices[short_symbol][last_day]
-        price_change_pct = (current_price - start_price) / start_price
-        short_pnl = -price_change_pct * allocation
-
-        # Period changes for short
-        pos_periods = {}
-        for period in ['all', 'month', 'week', 'day']:
-            ref_day = get_period_reference_day(trading_days, period)
-            if ref_day and ref_day in prices[short_symbol]:
-                ref_price = prices[short_symbol][ref_day]
-                # For short, negative stock movement = positive return
-                period_stock_change = ((current_price - ref_price) / ref_price) * 100
-                pos_periods[period] = round(-period_stock_change, 2)
-
-        positions.append({
-            'symbol': short_symbol,
-            'type': 'short',
-            'start_price': round(start_price, 2),
-            'current_price': round(current_price, 2),
-            'current_value': round(short_pnl, 2),
-            'gain_pct': round(-price_change_pct * 100, 2),
-            'periods': pos_periods
+    details = analytics['player_details'].get(player_index)
+    if details is None:
+        details = build_player_details(analytics, player_index)
+        analytics['player_details'][player_index] = details
+    return jsonify(details)
+
+def parse_backtest_request(competition, data):
+    """Turn a /api/backtest body into (rosters, start dates, end date), or raise ValueError."""
+    if not isinstance(data, dict):
+        raise ValueError('Expected a JSON object')
+    players = competition['players']
+    specs = data.get('rosters') or [{'player': i} for i in range(len(players))]
+    if not isinstance(specs, list) or not all(isinstance(spec, dict) for spec in specs):
+        raise ValueError('rosters must be a list of objects')
+    rosters = []
+    for spec in specs:
+        base = {}
+        if 'player' in spec:
+            if type(spec['player']) is not int or not 0 <= spec['player'] < len(players):
+                raise ValueError(f"Invalid player index: {spec['player']}")
+            base = players[spec['player']]
+        longs = spec.get('longs', base.get('longs'))
+        short = spec.get('short', base.get('short'))
+        if (not longs or not short or not isinstance(longs, list) or not isinstance(short, str)
+                or not all(isinstance(symbol, str) for symbol in longs)):
+            raise ValueError('Each roster needs longs and a short')
+        if len(longs) != len(base.get('longs', longs)):
+            raise ValueError('A roster must keep the same number of longs as the player it is based on')
+        rosters.append({
+            'name': spec.get('name', base.get('name', f"Roster {len(rosters) + 1}")),
+            'longs': [str(symbol).upper().strip() for symbol in longs],
+            'short': str(short).upper().strip()
         })
+    if len({len(roster['longs']) for roster in rosters}) > 1:
+        raise ValueError('All rosters must hold the same number of longs')
+
+    start_dates = data.get('start_dates') or [competition['start_date']]
+    end_date = data.get('end_date')
+    if not isinstance(start_dates, list):
+        raise ValueError('start_dates must be a list of dates')
+    earliest = (datetime.strptime(competition['start_date'], '%Y-%m-%d') - timedelta(days=BACKTEST_MAX_LOOKBACK_DAYS)).strftime('%Y-%m-%d')
+    for day in start_dates + ([end_date] if end_date else []):
+        try:
+            datetime.strptime(day, '%Y-%m-%d')
+        except (TypeError, ValueError):
+            raise ValueError(f"Dates must be YYYY-MM-DD: {day}")
+        if day < earliest:
+            raise ValueError(f"Dates must be on or after {earliest}: {day}")
+
+    if len(rosters) * len(start_dates) > MAX_BACKTEST_VARIANTS:
+        raise ValueError(f"At most {MAX_BACKTEST_VARIANTS} roster x start date combinations per request")
+    if len({s for roster in rosters for s in roster['longs'] + [roster['short']]}) > MAX_BACKTEST_SYMBOLS:
+        raise ValueError(f"At most {MAX_BACKTEST_SYMBOLS} distinct symbols per request")
+    return rosters, start_dates, end_date
+
+@app.route('/api/backtest', methods=['POST'], defaults={'competition_id': DEFAULT_COMPETITION_ID})
+@app.route('/api/competitions/<competition_id>/backtest', methods=['POST'])
+def backtest(competition_id):
+    """Evaluate what-if rosters from one or more start dates.
+
+    Body: {"rosters": [{"player": 2, "short": "TGT"}, {"longs": [...], "short": "..."}],
+           "start_dates": ["2025-01-02", ...], "end_date": "2025-12-31"}
+    Rosters default to the competition's players, start dates to its start
+    and the end date to the latest close. Every roster is run from every
+    start date; results are columnar, one entry per combination.
+    """
+    competition = load_competition(competition_id)
+    if not competition:
+        body, status = missing_competition(competition_id)
+        return jsonify(body), status
+
+    try:
+        rosters, start_dates, end_date = parse_backtest_request(competition, request.get_json(silent=True) or {})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    symbols = sorted({s for roster in rosters for s in roster['longs'] + [roster['short']]})
+    # Anything outside the league has to be a real ticker before its history
+    # is downloaded into the shared price cache
+    extra = sorted(set(symbols) - set(competition_symbols(competition)))
+    invalid = [symbol for symbol, is_valid in validate_symbols(extra).items() if not is_valid]
+    if invalid:
+        return jsonify({'error': f"Unknown symbols: {', '.join(invalid)}", 'invalid': invalid}), 400
+    prices = get_stock_data(symbols, min(start_dates))
+    if not prices:
+        return jsonify({'error': 'Failed to fetch stock data'}), 500
 
+    trading_days = sorted({day for series in prices.values() for day in series})
+    end = bisect_right(trading_days, end_date) - 1 if end_date else len(trading_days) - 1
+    if end < 0:
+        return jsonify({'error': 'No trading data before end_date'}), 400
+
+    sym_index = {symbol: j for j, symbol in enumerate(symbols)}
+    day_starts = [bisect_left(trading_days, day) for day in start_dates]
+    combos = [(r, k) for r in range(len(rosters)) for k, start in enumerate(day_starts) if start <= end]
+    if not combos:
+        return jsonify({'error': 'No start date falls on or before the last trading day'}), 400
+
+    roster_index = np.array([r for r, _ in combos])
+    starts = np.array([day_starts[k] for _, k in combos])
+    long_cols = np.array([[sym_index[s] for s in roster['longs']] for roster in rosters])[roster_index]
+    short_cols = np.array([sym_index[roster['short']] for roster in rosters])[roster_index]
+
+    with timed('backtest'):
+        matrix = build_price_matrix(prices, trading_days, symbols)
+        long_value, short_pnl, max_drawdown = run_backtest(
+            matrix, long_cols, short_cols, starts, end, competition['stock_allocation']
+        )
+
+    total = long_value + short_pnl
+    invested = competition['stock_allocation'] * long_cols.shape[1]
     return jsonify({
-        'name': player['name'],
-        'color': player['color'],
-        'positions': positions,
-        'symbols': all_symbols,
-        'performance': period_performance,
-        'as_of': last_day
+        'end_date': trading_days[end],
+        'rosters': rosters,
+        'results': {
+            'roster': roster_index.tolist(),
+            'start_date': [trading_days[i] for i in starts.tolist()],
+            'value': np.round(total, 2).tolist(),
+            'return_pct': np.round((total - invested) / invested * 100, 2).tolist(),
+            'short_pnl': np.round(short_pnl, 2).tolist(),
+            'max_drawdown_pct': np.round(max_drawdown * 100, 2).tolist()
+        }
     })
 
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    """Record route latency and add the Server-Timing header.
+
+    Registered before compress_response, so it runs after it and the
+    total includes compression.
+    """
+    started = g.get('request_started')
+    if started is None:
+        return response
+
+    elapsed = time.perf_counter() - started
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    observe_metric('cheesestick_http_request_seconds', elapsed, route=route, method=request.method, status=str(response.status_code))
+
+    if SERVER_TIMING:
+        timings = g.get('server_timing', {})
+        parts = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items()]
+        parts.append(f"total;dur={elapsed * 1000:.1f}")
+        response.headers['Server-Timing'] = ', '.join(parts)
+    return response
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    escaped = [
+        '{}="{}"'.format(key, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for key, value in labels
+    ]
+    return '{' + ','.join(escaped) + '}'
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus text exposition of this worker's metrics."""
+    with metrics_lock:
+        values = {key: (dict(value, buckets=list(value['buckets'])) if isinstance(value, dict) else value)
+                  for key, value in metric_values.items()}
+    with price_cache_lock:
+        price_cache_symbols = len(price_cache)
+
+    lines = []
+    for name, (kind, help_text) in METRICS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for (metric_name, labels), value in sorted(values.items()):
+            if metric_name != name:
+                continue
+            if kind == 'counter':
+                lines.append(f"{name}{format_labels(labels)} {value}")
+                continue
+            for bound, count in zip(LATENCY_BUCKETS, value['buckets']):
+                lines.append(f"{name}_bucket{format_labels(labels + (('le', str(bound)),))} {count}")
+            lines.append(f"{name}_bucket{format_labels(labels + (('le', '+Inf'),))} {value['count']}")
+            lines.append(f"{name}_sum{format_labels(labels)} {value['sum']}")
+            lines.append(f"{name}_count{format_labels(labels)} {value['count']}")
+
+    lines.append("# HELP cheesestick_price_cache_symbols Symbols held in the price cache")
+    lines.append("# TYPE cheesestick_price_cache_symbols gauge")
+    lines.append(f"cheesestick_price_cache_symbols {price_cache_symbols}")
+    lines.append("# HELP cheesestick_process_uptime_seconds Seconds since this worker started")
+    lines.append("# TYPE cheesestick_process_uptime_seconds gauge")
+    lines.append(f"cheesestick_process_uptime_seconds {time.time() - process_started:.0f}")
+
+    return app.response_class('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
+
+def preferred_encoding():
+    """Pick the best response compression the client accepts."""
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return 'identity'
+
+def compress_body(data, encoding):
+    with timed('compress'):
+        if encoding == 'br':
+            return brotli.compress(data, quality=5)
+        return gzip.compress(data, compresslevel=6)
+
+@app.after_request
+def compress_response(response):
+    """Compress large JSON responses that weren't compressed already."""
+    if (response.status_code != 200 or response.direct_passthrough
+            or response.is_streamed or response.mimetype != 'application/json'
+            or 'Content-Encoding' in response.headers):
+        return response
+
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_BYTES:
+        return response
+
+    encoding = preferred_encoding()
+    if encoding != 'identity':
+        response.set_data(compress_body(data, encoding))
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    return response
+
+@app.after_request
+def mark_stale_response(response):
+    """Flag responses served from last known good prices."""
+    as_of = g.get('stale_as_of')
+    if as_of:
+        response.headers['Warning'] = '110 - "Response is Stale"'
+        response.headers['X-Data-Stale'] = 'true'
+        response.headers['X-Data-As-Of'] = as_of
+    return response
+
 # Static files - must be last to not interfere with API routes
 @app.route('/<path:path>')
 def static_files(path):